@@ -0,0 +1,148 @@
+import CW_Savings
+import LocalSeatch
+import argparse
+import hashlib
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+knownBest = {                                                       # best known distances of the bundled instances
+    "solomon_25/C101.txt": 191.3, "solomon_25/C201.txt": 214.7, "solomon_25/R101.txt": 617.1,
+    "solomon_25/R201.txt": 463.3, "solomon_25/RC101.txt": 461.1, "solomon_25/RC201.txt": 360.2,
+    "solomon_50/C101.txt": 362.4, "solomon_50/C201.txt": 360.2, "solomon_50/R101.txt": 1044.0,
+    "solomon_50/R201.txt": 791.9, "solomon_50/RC101.txt": 944.0, "solomon_50/RC201.txt": 684.8,
+    "solomon_100/C101.txt": 827.3, "solomon_100/C201.txt": 589.1, "solomon_100/R101.txt": 1637.7,
+    "solomon_100/R201.txt": 1143.2, "solomon_100/RC101.txt": 1619.8, "solomon_100/RC201.txt": 1261.8,
+}
+operators = ["relocate", "exchange", "two_opt"]
+
+def version():
+    """Identify the CW_Savings.py that is benchmarked by the hash of its source."""
+    with open(CW_Savings.__file__, "rb") as fp:
+        sha1 = hashlib.sha1(fp.read()).hexdigest()
+    return {"module": os.path.abspath(CW_Savings.__file__), "sha1": sha1, "python": platform.python_version()}
+
+def run(file, seed, runs, iterations, repeats=5):
+    """Solve one instance with a fixed seed, once as a warm-up and then repeats times.
+    Every solve gets a freshly loaded instance, so no run profits from the route cache of another one. The timings
+    are those of the fastest repeat, as the slower ones only add noise from the machine.
+    Returns a dict with the wall time (and those of all repeats), the best valid objective (or -1), its gap to the
+    best known solution in % (None if unknown or no valid solution was found) and per operator the moves evaluated,
+    the time spent and the evaluations per second."""
+    LocalSeatch.solve(CW_Savings.VRP(file), seed=seed, runs=runs, iterations=iterations)     # warm-up
+    times = []
+    for _ in range(repeats):
+        myVRP = CW_Savings.VRP(file)
+        start = time.perf_counter()
+        mySolution, bestObjectiv, timedOut = LocalSeatch.solve(myVRP, seed=seed, runs=runs, iterations=iterations)
+        times.append(time.perf_counter() - start)
+        if times[-1] == min(times):
+            metrics = mySolution.metrics_dict()
+    wallTime = min(times)
+    best = knownBest.get(os.path.normpath(file).replace(os.sep, "/"))
+    result = {"file": file, "seed": seed, "time": wallTime, "times": times, "objective": bestObjectiv,
+              "gap": None if best is None or bestObjectiv == -1 else 100 * (bestObjectiv - best) / best,
+              "savingsTime": metrics["savings_algorithm"]["time"], "operators": {}, "metrics": metrics}
+    for name in operators:
+        evaluations = metrics[name]["evaluated"]
+        seconds = metrics[name]["time"]
+        result["operators"][name] = {"evaluations": evaluations, "time": seconds,
+                                     "evaluationsPerSecond": evaluations / seconds if seconds > 0 else None}
+    return result
+
+def summarize(results):
+    """Aggregate the results per instance: mean wall time, best and mean objective and gap, and the move
+    evaluations per second and mean time per seed of every operator over all seeds."""
+    summary = {}
+    for file in sorted(set(r["file"] for r in results)):
+        runs = [r for r in results if r["file"] == file]
+        valid = [r["objective"] for r in runs if r["objective"] != -1]
+        gaps = [r["gap"] for r in runs if r["gap"] is not None]
+        entry = {"time": statistics.mean(r["time"] for r in runs), "valid": len(valid),
+                 "best": min(valid) if valid else -1, "mean": statistics.mean(valid) if valid else -1,
+                 "bestGap": min(gaps) if gaps else None, "meanGap": statistics.mean(gaps) if gaps else None}
+        for name in operators:
+            evaluations = sum(r["operators"][name]["evaluations"] for r in runs)
+            seconds = sum(r["operators"][name]["time"] for r in runs)
+            entry[name] = evaluations / seconds if seconds > 0 else None
+            entry[name + "Time"] = seconds / len(runs)
+        summary[file] = entry
+    return summary
+
+def compare(old, new, timeTolerance, gapTolerance, minTime=0.2):
+    """Compare two benchmark files.
+    A regression is a mean wall time more than timeTolerance (relative) above the old one, an operator with
+    that much fewer evaluations per second, or a mean objective more than gapTolerance (in %) above the old
+    one. Times below minTime seconds (in either file) are too noisy and their speed is not checked.
+    Returns the list of regressions as strings."""
+    regressions = []
+    print("instance".ljust(24) + "time old".rjust(10) + "time new".rjust(10) + "mean old".rjust(11) + "mean new".rjust(11)
+          + "".join((name + " x").rjust(13) for name in operators))
+    for file, a in old["summary"].items():
+        b = new["summary"].get(file)
+        if b is None:
+            continue
+        speedups = []
+        for name in operators:
+            speedup = b[name] / a[name] if a[name] and b[name] else None
+            speedups.append("-" if speedup is None else str(round(speedup, 2)))
+            timed = min(a.get(name + "Time", 0), b.get(name + "Time", 0)) >= minTime
+            if speedup is not None and timed and speedup < 1 - timeTolerance:
+                regressions.append(file + ": " + name + " evaluates " + str(round(speedup, 2)) + "x as many moves per second")
+        print(file.ljust(24) + str(round(a["time"], 3)).rjust(10) + str(round(b["time"], 3)).rjust(10)
+              + str(round(a["mean"], 2)).rjust(11) + str(round(b["mean"], 2)).rjust(11) + "".join(s.rjust(13) for s in speedups))
+        if min(a["time"], b["time"]) >= minTime and b["time"] > a["time"] * (1 + timeTolerance):
+            regressions.append(file + ": wall time " + str(round(a["time"], 3)) + " s -> " + str(round(b["time"], 3)) + " s")
+        if b["valid"] < a["valid"]:
+            regressions.append(file + ": valid solutions " + str(a["valid"]) + " -> " + str(b["valid"]))
+        elif a["mean"] != -1 and b["mean"] > a["mean"] * (1 + gapTolerance / 100):
+            regressions.append(file + ": mean objective " + str(round(a["mean"], 2)) + " -> " + str(round(b["mean"], 2)))
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark CW_Savings on the bundled Solomon instances with fixed seeds.")
+    parser.add_argument("files", nargs="*", default=[f for folder in LocalSeatch.folders for f in folder])
+    parser.add_argument("--seeds", type=int, default=3, help="seeds 0..n-1 are run for every instance")
+    parser.add_argument("--runs", type=int, default=1)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--repeats", type=int, default=5, help="timed solves per seed after a warm-up, the fastest counts")
+    parser.add_argument("--output", default=None, help="write the settings, results and summary to this JSON file")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two JSON files instead of running")
+    parser.add_argument("--time-tolerance", type=float, default=0.3,
+                        help="allowed relative slowdown, wider than the drift between runs of the same code (default 0.3)")
+    parser.add_argument("--min-time", type=float, default=0.2,
+                        help="times below this many seconds are not checked for slowdowns (default 0.2)")
+    parser.add_argument("--gap-tolerance", type=float, default=0.0, help="allowed increase of the mean objective in %%")
+    args = parser.parse_args()
+
+    if args.compare is not None:
+        with open(args.compare[0]) as fp:
+            old = json.load(fp)
+        with open(args.compare[1]) as fp:
+            new = json.load(fp)
+        regressions = compare(old, new, args.time_tolerance, args.gap_tolerance, args.min_time)
+        for regression in regressions:
+            print("REGRESSION " + regression)
+        sys.exit(1 if regressions else 0)
+
+    results = []
+    print("instance".ljust(24) + "seed".rjust(5) + "time [s]".rjust(10) + "objective".rjust(11) + "gap [%]".rjust(9)
+          + "".join((name + " ev/s").rjust(15) for name in operators))
+    for file in args.files:
+        for seed in range(args.seeds):
+            result = run(file, seed, args.runs, args.iterations, args.repeats)
+            results.append(result)
+            print(file.ljust(24) + str(seed).rjust(5) + str(round(result["time"], 3)).rjust(10)
+                  + str(round(result["objective"], 2)).rjust(11)
+                  + ("-" if result["gap"] is None else str(round(result["gap"], 2))).rjust(9)
+                  + "".join(str(round(result["operators"][name]["evaluationsPerSecond"] or 0)).rjust(15) for name in operators),
+                  flush=True)
+    if args.output is not None:
+        settings = {"files": args.files, "seeds": args.seeds, "runs": args.runs, "iterations": args.iterations,
+                    "repeats": args.repeats}
+        with open(args.output, "w") as fp:
+            json.dump({"version": version(), "settings": settings, "results": results, "summary": summarize(results)},
+                      fp, indent=1)
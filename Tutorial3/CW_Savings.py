@@ -1,18 +1,152 @@
 import numpy as np
 from scipy.spatial.distance import pdist, squareform
+from scipy.spatial import cKDTree
 import random
+import functools
+import hashlib
+import math
+import numbers
+import os
+import csv
+import queue
+import sys
+import threading
+import time
+import zipfile
+from collections import OrderedDict, deque
+
+DELTA_EPS = 1e-7    # delta evaluations closer than this to a tie are re-checked by walking the route
+COUNTERS = ("evaluated", "accepted", "tabuRejects", "feasibilityRejects", "routeEvaluations", "time")
+QUIET, PROGRESS, SOLUTIONS, MOVES = range(4)    # trace levels, each prints the output of the lower ones as well
+TRACE_COLUMNS = ("run", "iteration", "operator", "objective", "elapsed")
+
+
+def tw_concat(seg1, seg2, travel):
+    """Concatenate two time-window segments.
+    A segment is a tuple (duration, timeWarp, earliest, latest) describing a sequence of visits: its minimal
+    duration incl. service and waiting, the total lateness (time warp) and the earliest and latest start at its first
+    visit giving that duration and time warp (Vidal et al. 2013). travel is the distance from the last visit of seg1
+    to the first visit of seg2. A route is time-window feasible iff depot + route + depot has no time warp."""
+    d1, tw1, e1, l1 = seg1
+    d2, tw2, e2, l2 = seg2
+    delta = d1 - tw1 + travel
+    wait = max(e2 - delta - l1, 0.0)
+    warp = max(e1 + delta - l2, 0.0)
+    return (d1 + d2 + travel + wait, tw1 + tw2 + warp, max(e2 - delta, e1) - wait, min(l2 - delta, l1) + warp)
+
+
+def route_arcs(route):
+    """Return the undirected arcs of a route (list of customers, depot = 0) as a set of sorted tuples."""
+    nodes = [0] + list(route) + [0]
+    return set((min(a, b), max(a, b)) for a, b in zip(nodes, nodes[1:]))
+
+
+def instrumented(method):
+    """Decorator for the VRP_Solution operators.
+    Adds the time spent in the method and the number of update_route calls made by it to the metrics of the
+    method's name. Nested instrumented calls are included in the caller's figures."""
+    name = method.__name__
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        metrics = self.metrics[name]
+        vrpdata = self.vrpdata
+        evaluations = vrpdata.RouteEvaluations
+        start = time.perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            metrics["time"] += time.perf_counter() - start
+            metrics["routeEvaluations"] += vrpdata.RouteEvaluations - evaluations
+    return wrapper
+
+class LazyDistMatrix:
+    """Class for computing Euclidean distances on demand.
+
+    Replaces the dense distance matrix for large instances: only the coordinates are stored (O(n) memory) and
+    distances are computed when they are accessed. Supports the indexing used on the dense matrix: dist[a][b],
+    dist[a, b] and NumPy fancy indexing with broadcasting."""
+
+    def __init__(self, coord):
+        """Initialize the distance matrix.
+        coord (array): n x 2 array of coordinates"""
+        self.Coord = np.asarray(coord, dtype=float)
+        self.shape = (len(self.Coord), len(self.Coord))
+        self.x = self.Coord[:, 0].tolist()      # Python floats for fast scalar access
+        self.y = self.Coord[:, 1].tolist()
+        self.rows = [LazyDistRow(self, a) for a in range(len(self.Coord))]
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            return self.distances(key[0], key[1])
+        if isinstance(key, numbers.Integral):
+            return self.rows[key]
+        return self.distances(key, slice(None))
+
+    def distance(self, a, b):
+        """Distance between two nodes."""
+        dx = self.x[a] - self.x[b]
+        dy = self.y[a] - self.y[b]
+        return math.sqrt(dx*dx + dy*dy)
+
+    def distances(self, a, b):
+        """Distances between index arrays a and b (broadcast like NumPy fancy indexing, two slices give a block)."""
+        if isinstance(a, slice) and isinstance(b, slice):
+            a = np.arange(self.shape[0])[a][:, None]
+        dx = self.Coord[a, 0] - self.Coord[b, 0]
+        dy = self.Coord[a, 1] - self.Coord[b, 1]
+        return np.sqrt(dx*dx + dy*dy)
+
+
+class LazyDistRow:
+    """Class for a single row dist[a] of a LazyDistMatrix."""
+
+    def __init__(self, matrix, a):
+        self.matrix = matrix
+        self.a = a
+
+    def __getitem__(self, b):
+        if isinstance(b, numbers.Integral):
+            return self.matrix.distance(self.a, b)
+        return self.matrix.distances(self.a, b)
+
 
 class VRP:
     """Class for vehicle routing problems.
 
-    Can load data from text files (Solomon instances) excl. irrelevant data such as time windows"""
+    Can load data from text files (Solomon instances) incl. time windows and service times"""
 
-    def __init__(self, instancefile):
+    def __init__(self, instancefile, k=10, cachedir=None, dense=True, routecache=50000):
         """Initialize the vrp data object.
 
-        Read all the data from the instancefile (string) - text file according to Solomon format"""
-        coord = []; demand = []; timew = []; servicet = []                                          # initialize lists
+        Read all the data from the instancefile (string) - text file according to Solomon format.
+        k (int): number of nearest neighbours per customer used by the granular operators (default=10)
+        cachedir (string): directory for binary instance caches (default=None: always parse the text file)
+        dense (bool): store the full distance matrix; False computes distances on demand and finds neighbours with
+        a KD-tree, for instances too large for an n x n matrix (default=True)
+        routecache (int): total length (customers) of the route evaluations kept in an LRU cache for update_route,
+        about 0.7 KB each; 0 disables it (default=50000)"""
         self.InstanceFile = instancefile
+        self.DenseDist = dense
+        cachepath = self.cache_path(cachedir) if cachedir is not None and dense else None    # hash the file only once
+        if not dense:
+            self.read_instance(instancefile)
+            self.DistMatrix = LazyDistMatrix(self.Coord)
+        elif cachepath is None or not self.load_cache(cachepath):
+            self.read_instance(instancefile)
+            self.DistMatrix = squareform(pdist(self.Coord,"euclidean"))     # compute distance matrix
+            if cachepath is not None:
+                self.write_cache(cachepath)
+        self.Segments = [(float(s), 0.0, float(tw[0]), float(tw[1])) for s, tw in zip(self.CustSerT, self.CustTW)]
+        self.RouteEvaluations = 0       # number of update_route calls for this instance
+        self.RouteCache = RouteCache(routecache) if routecache else None
+        self.set_neighbours(k, cachepath)
+
+    def read_instance(self, instancefile):
+        """Read the instance data from a text file according to Solomon format."""
+        coord = []; demand = []; timew = []; servicet = []                                          # initialize lists
         with open(instancefile,"r") as iFile:               # read data from file
             self.InstanceName = iFile.readline().strip()    # name of instamce
             iFile.readline(); iFile.readline(); iFile.readline()    # skip lines
@@ -33,7 +167,90 @@ class VRP:
         self.CustTW = np.array(timew)
         self.CustSerT = np.array(servicet)
         self.CustDem = np.array(demand)
-        self.DistMatrix = squareform(pdist(self.Coord,"euclidean"))     # compute distance matrix
+
+    def cache_path(self, cachedir):
+        """Path prefix of the cache files of the instance.
+        The name contains a hash of the source file, so a changed instance file gets a new cache."""
+        with open(self.InstanceFile, "rb") as iFile:
+            digest = hashlib.sha1(iFile.read()).hexdigest()[:16]
+        name = os.path.splitext(os.path.basename(self.InstanceFile))[0]
+        return os.path.join(cachedir, name + "-" + digest)
+
+    def load_cache(self, path):
+        """Load the instance from its cache files, path is the prefix from cache_path.
+        The distance matrix is opened with np.memmap (read-only), so processes using the same cache share its pages.
+        Returns False if there is no cache for the current source file."""
+        if not (os.path.exists(path + ".npz") and os.path.exists(path + ".dist.npy")):
+            return False
+        with np.load(path + ".npz") as data:
+            self.InstanceName = str(data["InstanceName"])
+            self.MaxNumVeh = int(data["MaxNumVeh"])
+            self.MaxVehCap = float(data["MaxVehCap"])
+            self.Coord = data["Coord"]
+            self.CustTW = data["CustTW"]
+            self.CustSerT = data["CustSerT"]
+            self.CustDem = data["CustDem"]
+        self.NumCust = len(self.Coord)-1
+        self.DistMatrix = np.asarray(np.load(path + ".dist.npy", mmap_mode="r"))  # plain ndarray view of the memmap
+        return True
+
+    def write_cache(self, path):
+        """Write the instance data and the distance matrix to the cache files with the prefix path (see cache_path).
+        Files are written under a temporary name and renamed, so concurrent readers never see a partial file."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = path + "." + str(os.getpid()) + ".tmp"
+        with open(tmp, "wb") as fp:
+            np.save(fp, self.DistMatrix)
+        os.replace(tmp, path + ".dist.npy")
+        with open(tmp, "wb") as fp:
+            np.savez(fp, InstanceName=self.InstanceName, MaxNumVeh=self.MaxNumVeh, MaxVehCap=self.MaxVehCap,
+                     Coord=self.Coord, CustTW=self.CustTW, CustSerT=self.CustSerT, CustDem=self.CustDem)
+        os.replace(tmp, path + ".npz")
+
+    def set_neighbours(self, k, cachepath=None):
+        """Compute the k-nearest-neighbour candidate lists.
+        Neighbours[c] holds the k customers closest to c (sorted by distance), NeighbourSets[c] the same customers
+        plus the depot, as arcs to the depot are always allowed. With cachepath (prefix from cache_path) the lists
+        are stored next to the cached distance matrix and loaded from there, one file per k."""
+        k = max(0, min(k, self.NumCust - 1))
+        self.NumNeighbours = k
+        path = cachepath + ".k" + str(k) + ".npy" if cachepath is not None else None
+        if not self.DenseDist:
+            self.Neighbours = self.query_neighbours(k)
+        elif path is not None and os.path.exists(path):
+            self.Neighbours = np.load(path)
+        else:
+            self.Neighbours = self.dense_neighbours(k)
+            if path is not None:
+                tmp = path + "." + str(os.getpid()) + ".tmp"
+                with open(tmp, "wb") as fp:
+                    np.save(fp, self.Neighbours)
+                os.replace(tmp, path)
+        self.NeighbourSets = [set(row) | {0} for row in self.Neighbours.tolist()]
+
+    def dense_neighbours(self, k, block=256):
+        """Find the k nearest customers of every node in the distance matrix.
+        Rows are processed in blocks, so a memmapped matrix is never copied as a whole."""
+        neighbours = np.empty((self.NumCust+1, k), dtype=int)
+        for first in range(0, self.NumCust+1, block):
+            rows = np.arange(first, min(first + block, self.NumCust+1))
+            dist = np.array(self.DistMatrix[first:rows[-1]+1, 1:])
+            own = rows > 0
+            dist[np.nonzero(own)[0], rows[own] - 1] = np.inf        # a customer is not its own neighbour
+            near = np.argpartition(dist, k, axis=1)[:, :k]
+            order = np.argsort(np.take_along_axis(dist, near, axis=1), axis=1, kind="stable")
+            neighbours[rows] = np.take_along_axis(near, order, axis=1) + 1
+        return neighbours
+
+    def query_neighbours(self, k):
+        """Find the k nearest customers of every node with a KD-tree over the customer coordinates."""
+        if k == 0:
+            return np.zeros((self.NumCust+1, 0), dtype=int)
+        self.SpatialIndex = cKDTree(self.Coord[1:])
+        near = self.SpatialIndex.query(self.Coord, k+1)[1].reshape(self.NumCust+1, k+1) + 1
+        own = near == np.arange(self.NumCust+1)[:, None]      # drop the customer itself, or the farthest one
+        own[~own.any(axis=1), k] = True
+        return near[~own].reshape(self.NumCust+1, k)
 
 class VRP_Route:
     """Class for representing a single route in the VRP.
@@ -46,12 +263,29 @@ class VRP_Route:
         route (list): list of visited customers excl. depot (default=[])
         distance(float): indicates the distance of the route
         quantity(float): total demand met on the route
-        tourValid(bool): Is the capacity restriction of vehicles fulfilled."""
+        serviceTime(float): duration of the route incl. travel, service and waiting times
+        timeWarp(float): total lateness at the customers and the depot, 0 if all time windows are met
+        tourValid(bool): Are the capacity restriction of vehicles and the time windows fulfilled.
+        cumDistance, cumQuantity(list): prefix sums up to and incl. the customer at each position
+        arrival, waiting, start(list): arrival, waiting and service start time at each position (leaving the depot
+        at its ready time)
+        latestStart(list): latest service start at each position that keeps the rest of the route feasible
+        prefix, suffix(list): time-window segments (see tw_concat) of depot..position and position..depot"""
 
         self.route = r
         self.distance = 0
         self.quantity = 0
+        self.serviceTime = 0
+        self.timeWarp = 0
         self.tourValid = False
+        self.cumDistance = []
+        self.cumQuantity = []
+        self.arrival = []
+        self.waiting = []
+        self.start = []
+        self.latestStart = []
+        self.prefix = []
+        self.suffix = []
 
     def __str__(self):
         """Convert a route into a string.
@@ -65,39 +299,365 @@ class VRP_Route:
 
     def update_route(self, vrpdata):
         """"Update route data.
-        Use the VRP data from vrpdata to compute current distance, quantity, checks tourValid """
+        Use the VRP data from vrpdata to compute current distance, quantity, checks tourValid.
+        Prefix sums, arrival/waiting/start times, latest start times and the time-window segments of all prefixes
+        and suffixes are cached for O(1) move evaluation."""
+        vrpdata.RouteEvaluations += 1
+        cache = vrpdata.RouteCache
+        if cache is not None:
+            key = tuple(self.route)
+            values = cache.get(key)
+            if values is not None:      # the lists are shared with the cache and must not be modified
+                (self.distance, self.quantity, self.serviceTime, self.timeWarp, self.tourValid, self.cumDistance,
+                 self.cumQuantity, self.arrival, self.waiting, self.start, self.latestStart, self.prefix,
+                 self.suffix) = values
+                return
+        dist = vrpdata.DistMatrix
+        segments = vrpdata.Segments
         self.distance = 0
         self.quantity = 0
-        self.serviceTime = 0
         self.tourValid = False
+        self.cumDistance = []
+        self.cumQuantity = []
+        self.arrival = []
+        self.waiting = []
+        self.start = []
+        self.prefix = []
+        time = vrpdata.CustTW[0][0]     # leave the depot at its ready time
+        seg = segments[0]
         lastc = 0   # first entry is depot
         for c in self.route:
-            self.distance += vrpdata.DistMatrix[lastc][c]
+            self.distance += dist[lastc][c]
             self.quantity += vrpdata.CustDem[c]
-            self.serviceTime += vrpdata.DistMatrix[lastc][c] + vrpdata.CustSerT[c]
+            self.cumDistance.append(self.distance)
+            self.cumQuantity.append(self.quantity)
+            arrival = time + dist[lastc][c]
+            start = max(arrival, vrpdata.CustTW[c][0])
+            self.arrival.append(arrival)
+            self.waiting.append(start - arrival)
+            self.start.append(start)
+            time = start + vrpdata.CustSerT[c]
+            seg = tw_concat(seg, segments[c], dist[lastc][c])
+            self.prefix.append(seg)
             lastc = c
-        self.distance += vrpdata.DistMatrix[lastc][0]  # last entry is depot
-        self.tourValid =((self.quantity <= vrpdata.MaxVehCap) and (self.serviceTime <= vrpdata.CustTW[0][1]))
+        self.distance += dist[lastc][0]  # last entry is depot
+        seg = tw_concat(seg, segments[0], dist[lastc][0])
+        self.serviceTime = seg[0]
+        self.timeWarp = seg[1]
+        self.suffix = [None] * len(self.route)
+        seg = segments[0]
+        nextc = 0
+        for pos in range(len(self.route)-1, -1, -1):
+            c = self.route[pos]
+            seg = tw_concat(segments[c], seg, dist[c][nextc])
+            self.suffix[pos] = seg
+            nextc = c
+        self.latestStart = [s[3] for s in self.suffix]
+        self.tourValid = (self.quantity <= vrpdata.MaxVehCap) and (self.timeWarp <= DELTA_EPS)
+        if cache is not None:
+            cache.put(key, (self.distance, self.quantity, self.serviceTime, self.timeWarp, self.tourValid,
+                            self.cumDistance, self.cumQuantity, self.arrival, self.waiting, self.start,
+                            self.latestStart, self.prefix, self.suffix))
+
+class TabuMemory:
+    """Class for the tabu memory of the local search.
+
+    Stores forbidden moves as (customer, position) tuples with O(1) membership tests, an iteration-based tenure
+    and a bounded size"""
+
+    def __init__(self, tenure=None, maxSize=None, aspiration=False):
+        """Initialize a tabu memory.
+
+        tenure(int): number of iterations a move stays tabu (default=None: until it is trimmed)
+        maxSize(int): maximum number of stored moves, the oldest are dropped first (default=None: unbounded)
+        aspiration(bool): allow tabu moves leading to an objective below aspirationLevel (default=False)
+        iteration(int): current iteration of the search, advanced by tick()"""
+        self.tenure = tenure
+        self.maxSize = maxSize
+        self.aspiration = aspiration
+        self.aspirationLevel = None
+        self.iteration = 0
+        self.entries = deque()      # (move, expiry iteration) in insertion order
+        self.counts = {}            # number of stored entries per move
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return (move for move, expiry in self.entries)
+
+    def __contains__(self, move):
+        return tuple(move) in self.counts
+
+    def __iadd__(self, other):
+        """Add all moves of another tabu memory (or list of moves) in their order."""
+        for move in list(other):
+            self.append(move)
+        return self
+
+    def append(self, move):
+        """Make a move tabu.
+        move (list or tuple): [customer, position]"""
+        move = tuple(move)
+        self.entries.append((move, None if self.tenure is None else self.iteration + self.tenure))
+        self.counts[move] = self.counts.get(move, 0) + 1
+        if self.maxSize is not None:
+            self.trim(self.maxSize)
+
+    def pop_oldest(self):
+        """Remove the oldest entry."""
+        move, expiry = self.entries.popleft()
+        self.counts[move] -= 1
+        if self.counts[move] == 0:
+            del self.counts[move]
+
+    def trim(self, n):
+        """Keep only the n newest entries."""
+        while len(self.entries) > n:
+            self.pop_oldest()
+
+    def tick(self):
+        """Advance the iteration counter and drop the moves whose tenure has expired."""
+        self.iteration += 1
+        while self.entries and self.entries[0][1] is not None and self.entries[0][1] <= self.iteration:
+            self.pop_oldest()
+
+    def update_aspiration(self, objective):
+        """Lower the aspiration level to objective if it is better."""
+        if self.aspirationLevel is None or objective < self.aspirationLevel:
+            self.aspirationLevel = objective
+
+    def forbids(self, move, objective=None):
+        """Check whether a move is tabu.
+        A tabu move is allowed if aspiration is enabled and it leads to an objective below the aspiration level."""
+        if tuple(move) not in self.counts:
+            return False
+        return not (self.aspiration and objective is not None and self.aspirationLevel is not None
+                    and objective < self.aspirationLevel)
+
+
+class RouteCache:
+    """Class for an LRU cache of route evaluations.
+
+    Maps customer sequences (tuples) to the data computed by VRP_Route.update_route, so routes that are evaluated
+    again, e.g. by get_objective or when the search returns to an earlier solution, are not walked"""
+
+    def __init__(self, maxSize):
+        """Initialize an empty cache.
+
+        maxSize(int): maximum total length (customers) of the stored routes, as the memory of an entry grows with it;
+        the least recently used routes are evicted first
+        customers(int): total length of the stored routes
+        hits, misses, evictions(int): statistics of get and put"""
+        self.maxSize = maxSize
+        self.entries = OrderedDict()
+        self.customers = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """Return the values stored for key and mark them as recently used, or None."""
+        values = self.entries.get(key)
+        if values is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return values
+
+    def put(self, key, values):
+        """Store the values of key, evicting the least recently used entries if the cache is full."""
+        if key not in self.entries:
+            self.customers += len(key)
+        self.entries[key] = values
+        self.entries.move_to_end(key)
+        while self.customers > self.maxSize and len(self.entries) > 1:
+            evicted, values = self.entries.popitem(last=False)
+            self.customers -= len(evicted)
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.customers = 0
+
+    def stats(self):
+        """Return the size and the hit/miss statistics as a dict."""
+        lookups = self.hits + self.misses
+        return {"size": len(self.entries), "customers": self.customers, "maxSize": self.maxSize, "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions, "hitRate": self.hits / lookups if lookups else None}
+
+
+class Trace:
+    """Class for a buffered, levelled trace of a search.
+
+    Convergence points (run, iteration, operator, objective, elapsed seconds) are collected in columns and written
+    to a CSV or NPZ file in batches; messages are only printed up to the trace level"""
+
+    def __init__(self, level=QUIET, path=None, batchSize=10000, background=False, stream=None):
+        """Initialize an empty trace.
+
+        level(int): QUIET prints nothing, PROGRESS every new best solution, SOLUTIONS the solution after every step
+        and MOVES also the new routes of every accepted move
+        path(string): .csv or .npz file the points are written to, None keeps all points in memory (default=None)
+        batchSize(int): number of buffered points that triggers a write (default=10000)
+        background(bool): write the batches from a background thread (default=False)
+        stream(file): where messages are printed (default=None: sys.stdout)
+        columns(dict): buffered points, one list per name in TRACE_COLUMNS
+        written(int): number of points written to path"""
+        self.level = level
+        self.path = path
+        self.batchSize = batchSize
+        self.stream = stream
+        self.start = time.perf_counter()
+        self.columns = {name: [] for name in TRACE_COLUMNS}
+        self.written = 0
+        self.batches = 0
+        self.queue = None
+        self.thread = None
+        self.error = None
+        if path is not None:
+            if not path.endswith((".csv", ".npz")):
+                raise ValueError("trace files must be .csv or .npz: " + path)
+            if os.path.exists(path):
+                os.remove(path)                                         # batches are appended to the file
+            if background:
+                self.queue = queue.Queue()
+                self.thread = threading.Thread(target=self.writer, daemon=True)
+                self.thread.start()
+
+    def __len__(self):
+        return self.written + len(self.columns["objective"])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def point(self, run, iteration, operator, objective):
+        """Buffer a convergence point; a full buffer is written to path."""
+        columns = self.columns
+        columns["run"].append(run)
+        columns["iteration"].append(iteration)
+        columns["operator"].append(operator)
+        columns["objective"].append(objective)
+        columns["elapsed"].append(time.perf_counter() - self.start)
+        if self.path is not None and len(columns["objective"]) >= self.batchSize:
+            self.flush()
+
+    def message(self, level, text):
+        """Print text if the trace level is at least level."""
+        if self.level >= level:
+            print(text, file=self.stream if self.stream is not None else sys.stdout)
+
+    def arrays(self):
+        """Return the buffered points as a dict of NumPy arrays."""
+        return {name: np.array(values) for name, values in self.columns.items()}
+
+    def flush(self):
+        """Hand the buffered points to the writer (the background thread, if any) and empty the buffer."""
+        if self.path is None or not self.columns["objective"]:
+            return
+        batch = self.columns
+        self.columns = {name: [] for name in TRACE_COLUMNS}
+        if self.queue is not None:
+            self.queue.put(batch)
+        else:
+            self.write(batch)
+
+    def write(self, batch):
+        """Append a batch of points to path: rows of a CSV file or one array per column and batch in an NPZ file."""
+        if self.path.endswith(".csv"):
+            with open(self.path, "a", newline="") as fp:
+                writer = csv.writer(fp)
+                if self.written == 0:
+                    writer.writerow(TRACE_COLUMNS)
+                writer.writerows(zip(*(batch[name] for name in TRACE_COLUMNS)))
+        else:
+            with zipfile.ZipFile(self.path, "a") as archive:
+                for name in TRACE_COLUMNS:
+                    with archive.open(name + "_" + str(self.batches).zfill(6) + ".npy", "w") as fp:
+                        np.lib.format.write_array(fp, np.array(batch[name]))
+        self.written += len(batch["objective"])
+        self.batches += 1
+
+    def writer(self):
+        """Background thread: write the queued batches until close puts None."""
+        while True:
+            batch = self.queue.get()
+            if batch is None:
+                return
+            try:
+                self.write(batch)
+            except Exception as error:
+                self.error = error
+
+    def close(self):
+        """Write the remaining points and stop the background thread."""
+        self.flush()
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+        if self.error is not None:
+            raise self.error
+
+
+def read_trace(path):
+    """Return the points of a trace file (.csv or .npz) as a dict of NumPy arrays, see TRACE_COLUMNS."""
+    if path.endswith(".npz"):
+        with np.load(path) as data:
+            return {name: np.concatenate([data[key] for key in sorted(data.files) if key.rsplit("_", 1)[0] == name])
+                    for name in TRACE_COLUMNS}
+    with open(path, newline="") as fp:
+        rows = list(csv.reader(fp))
+    columns = dict(zip(rows[0], zip(*rows[1:]))) if len(rows) > 1 else dict.fromkeys(rows[0], ())
+    return {"run": np.array(columns["run"], dtype=int), "iteration": np.array(columns["iteration"], dtype=int),
+            "operator": np.array(columns["operator"], dtype=str), "objective": np.array(columns["objective"], dtype=float),
+            "elapsed": np.array(columns["elapsed"], dtype=float)}
 
 
 class VRP_Solution:
     """Class for representing a solution to the VRP.
     Used to manage the solution itself."""
 
-    def __init__(self, vrpdata):
+    def __init__(self, vrpdata, tenure=None, aspiration=False):
         """Initialize a VRP solution.
         vrpdata(VRP): object holding all necessary VRP data.
+        tenure(int): iterations a move stays in the tabu memories, see TabuMemory (default=None: until it is cleared)
+        aspiration(bool): allow tabu moves leading to a new best objective, see update_aspiration (default=False)
         objective(float): total distance of all routes or -1 if solution is not valid.
         routes(list):  list of VRP_Route objects
-        solutionValid(bool): Does the solution only contain valid routes and is the max no. of vehicles not exceeded?"""
+        solutionValid(bool): Does the solution only contain valid routes and is the max no. of vehicles not exceeded?
+        metrics(dict): counters of savings_algorithm, get_objective and the operators, see COUNTERS and metrics_dict
+        moveHook(callable): called as moveHook(operator, solution, routes) with the new routes of every accepted move
+        iterationHook(callable): called by the search driver after every iteration (default=None)
+        journal(list): undo entries of all route changes since mark/commit, None if journaling is off
+        insertions(dict): cached insertion costs per route object, see insertion_costs
+        compact(CompactSolution): array view of the routes used by relocate_inter_compact, None until its first call
+        trace(Trace): prints the new routes of accepted moves at level MOVES, None prints nothing (default=None)
+        cacheStart(dict): RouteCache statistics when the solution was created, see metrics_dict"""
         self.vrpdata = vrpdata
+        self.cacheStart = vrpdata.RouteCache.stats() if vrpdata.RouteCache is not None else None
         self.objective = 0
         self.routes = []
         self.solutionValid = False
-        self.TabuRelocate = []
-        self.TabuExchange = []
-        self.TabuTwoOpt = []
-        self.GlobalTabu = []
+        self.TabuRelocate = TabuMemory(tenure, aspiration=aspiration)
+        self.TabuExchange = TabuMemory(tenure, aspiration=aspiration)
+        self.TabuTwoOpt = TabuMemory(tenure, aspiration=aspiration)
+        self.GlobalTabu = TabuMemory(tenure, maxSize=1000000, aspiration=aspiration)
+        self.rng = np.random.default_rng()     # random numbers for the batched operators
+        self.metrics = {name: dict.fromkeys(COUNTERS, 0) for name in ("savings_algorithm", "get_objective", "relocate", "relocate_inter", "relocate_inter_compact", "exchange", "two_opt", "vnd")}
+        self.moveHook = None
+        self.iterationHook = None
+        self.journal = None
+        self.insertions = {}
+        self.compact = None
+        self.trace = None
 
     def __str__(self):
         """Convert a solution into a string.
@@ -111,6 +671,101 @@ class VRP_Solution:
             count += 1
         return output
 
+    def metrics_dict(self):
+        """Return a copy of the metrics that can be dumped to JSON.
+        evaluated: candidate moves (savings entries for savings_algorithm), accepted: applied moves (merges),
+        tabuRejects: candidates rejected by the tabu memories, feasibilityRejects: candidates violating capacity or
+        time windows, routeEvaluations: update_route calls, time: seconds incl. nested calls. routeCache holds the
+        statistics of the instance's RouteCache (if any): hits, misses and evictions since this solution was created,
+        as the cache is shared by all solutions of the instance, and its current size."""
+        metrics = {name: dict(values) for name, values in self.metrics.items()}
+        if self.vrpdata.RouteCache is not None:
+            stats = self.vrpdata.RouteCache.stats()
+            for key in ("hits", "misses", "evictions"):
+                stats[key] -= self.cacheStart[key]
+            lookups = stats["hits"] + stats["misses"]
+            stats["hitRate"] = stats["hits"] / lookups if lookups else None
+            metrics["routeCache"] = stats
+        return metrics
+
+    def set_route(self, loc, route):
+        """Replace the route at index loc by route, recording the change in the journal.
+        Routes are never changed in place by the operators, so an undo only has to put the old objects back."""
+        if self.journal is not None:
+            self.journal.append((loc, self.routes[loc], self.objective, self.solutionValid))
+        self.insertions.pop(self.routes[loc], None)
+        self.routes[loc] = route
+
+    def set_routes(self, routes):
+        """Replace the whole list of routes, recording the change in the journal."""
+        if self.journal is not None:
+            self.journal.append((None, self.routes, self.objective, self.solutionValid))
+        kept = set(routes)
+        for r in self.routes:
+            if r not in kept:
+                self.insertions.pop(r, None)
+        self.routes = routes
+
+    def mark(self):
+        """Start journaling if it is off and return a mark that undo can roll back to."""
+        if self.journal is None:
+            self.journal = []
+        return len(self.journal)
+
+    def commit(self):
+        """Forget the journal: the current routes become the state that undo() rolls back to."""
+        if self.journal is not None:
+            self.journal = []
+
+    def undo(self, mark=0):
+        """Roll back all route changes made after mark, in time proportional to the number of changes.
+        The objective and validity are restored as well; the tabu memories and metrics are not.
+        Without a journal (no mark, or it was dropped) there is nothing to roll back."""
+        if self.journal is None:
+            return
+        while len(self.journal) > mark:
+            loc, route, objective, solutionValid = self.journal.pop()
+            if loc is None:
+                self.insertions.clear()
+                self.routes = route
+            else:
+                self.insertions.pop(self.routes[loc], None)
+                self.routes[loc] = route
+            self.objective = objective
+            self.solutionValid = solutionValid
+
+    def snapshot(self):
+        """Return an immutable copy of the routes as a tuple of customer tuples."""
+        return tuple(tuple(r.route) for r in self.routes)
+
+    def committed_snapshot(self):
+        """Return a snapshot of the routes undo() would roll back to, without changing the solution."""
+        routes = list(self.routes)
+        for loc, route, objective, solutionValid in reversed(self.journal or []):
+            if loc is None:
+                routes = list(route)
+            else:
+                routes[loc] = route
+        return tuple(tuple(r.route) for r in routes)
+
+    def restore(self, snapshot):
+        """Replace the routes by those of a snapshot and recompute the objective."""
+        routes = []
+        for route in snapshot:
+            routes.append(VRP_Route(list(route)))
+        self.set_routes(routes)
+        return self.get_objective()
+
+    def accepted(self, operator, routes, moves=1):
+        """Count moves accepted moves of operator, trace their new routes and fire moveHook with them."""
+        self.metrics[operator]["accepted"] += moves
+        if self.trace is not None and self.trace.level >= MOVES:
+            for route in routes:
+                self.trace.message(MOVES, route)
+        if self.moveHook is not None:
+            self.moveHook(operator, self, routes)
+
+    @instrumented
     def get_objective(self):
         """Update all route data and compute the objective.
         It returns the objective (total distance) or -1 if the solution is not valid."""
@@ -121,157 +776,1320 @@ class VRP_Solution:
         # all() returns True if all elements of the iterable are true
         self.solutionValid = (all([r.tourValid for r in self.routes]) and len(self.routes) <= self.vrpdata.MaxNumVeh)
         if self.solutionValid:
+            self.update_aspiration(self.objective)
             return self.objective
         return -1
 
+    def is_tabu(self, memory, moves, t, objective=None):
+        """Check moves against the tabu memories.
+        Returns True if any of the moves is forbidden by memory or, if t is True, by GlobalTabu. objective is the
+        objective the moves lead to and is used for the aspiration criterion."""
+        for move in moves:
+            if memory.forbids(move, objective) or ((t == True) and self.GlobalTabu.forbids(move, objective)):
+                return True
+        return False
+
+    def tick_tabu(self):
+        """Advance the iteration of all tabu memories so that moves with an expired tenure are released."""
+        for memory in (self.TabuRelocate, self.TabuExchange, self.TabuTwoOpt, self.GlobalTabu):
+            memory.tick()
+
+    def update_aspiration(self, objective):
+        """Lower the aspiration level of all tabu memories to objective, the best valid objective found so far."""
+        for memory in (self.TabuRelocate, self.TabuExchange, self.TabuTwoOpt, self.GlobalTabu):
+            memory.update_aspiration(objective)
+
     def generate_trivial_tours(self):
         """Generate a trivial solution.
         Generates a solution with 0->i->0 tours"""
-        self.routes = []
+        routes = []
         for c in range(1, self.vrpdata.NumCust+1):
-            self.routes.append(VRP_Route([c]))
+            routes.append(VRP_Route([c]))
+        self.set_routes(routes)
         return self.get_objective()
 
     def savings2routes(self,r1,r2):
         """Computes the savings if two routes are joined.
-        It creates an new route consisting of 2 VRP_Route objects r1 and r2 and returns the cost savings (positive)
-        or increase (negative). It returns -1 if the new route violates any constraints"""
-        newRoute = VRP_Route(r1.route+r2.route)
-        newRoute.update_route(self.vrpdata)     # compute distance, quantity for newRoute, check whether valid
-        if newRoute.tourValid:
-            return r1.distance + r2.distance - newRoute.distance
+        Evaluates the route r1 followed by r2 (2 VRP_Route objects) in O(1) from their cached data and returns the
+        cost savings (positive) or increase (negative). It returns -1 if the new route violates any constraints"""
+        dist = self.vrpdata.DistMatrix
+        a = r1.route[-1]
+        b = r2.route[0]
+        savings = dist[a][0] + dist[0][b] - dist[a][b]
+        if (r1.quantity + r2.quantity <= self.vrpdata.MaxVehCap) \
+            and (tw_concat(r1.prefix[-1], r2.suffix[0], dist[a][b])[1] <= DELTA_EPS):
+            return savings
         return -1
 
+    def savings_list(self):
+        """Compute the savings list.
+        Returns the savings s_ij = d0i + d0j - dij of all customer pairs with positive savings as three arrays
+        (savings, i, j) sorted by decreasing savings. Without a dense distance matrix only pairs of nearest
+        neighbours are considered."""
+        dist = self.vrpdata.DistMatrix
+        n = self.vrpdata.NumCust
+        if not self.vrpdata.DenseDist:
+            k = self.vrpdata.NumNeighbours
+            i = np.repeat(np.arange(1, n+1), k)
+            j = self.vrpdata.Neighbours[1:].ravel()
+            pairs = np.unique(np.concatenate((i*(n+1) + j, j*(n+1) + i)))    # both directions, no duplicates
+            i = pairs // (n+1)
+            j = pairs % (n+1)
+            s = dist[0, i] + dist[0, j] - dist[i, j]
+            keep = s > 0
+            s, i, j = s[keep], i[keep] - 1, j[keep] - 1
+        else:
+            d0 = dist[0][1:n+1]
+            s = d0[:, None] + d0[None, :] - dist[1:n+1, 1:n+1]     # savings matrix for customers 1..n
+            np.fill_diagonal(s, 0)
+            i, j = np.nonzero(s > 0)
+            s = s[i, j]
+        order = np.argsort(-s, kind="stable")                 # decreasing savings
+        return s[order], i[order] + 1, j[order] + 1
+
+    @instrumented
     def savings_algorithm(self, p):
         """Perform the savings algorithm
-        Performs the savings algorithm and generates a solution"""
+        Performs the savings algorithm and generates a solution.
+        All savings are computed once and scanned in decreasing order; a merge joins the route ending in i with
+        the route starting in j. Capacity and time windows are checked in O(1) from the route totals and
+        time-window segments. Every feasible merge is accepted with probability p, so p=1 gives the classical
+        greedy algorithm and p<1 samples among the best feasible savings."""
         self.generate_trivial_tours()       # generate trivial solution
+        vrpdata = self.vrpdata
+        dist = vrpdata.DistMatrix
+        s, si, sj = self.savings_list()
+        si = si.tolist(); sj = sj.tolist()
+        n = vrpdata.NumCust
+        routeOf = list(range(n+1))          # route id of each customer (id = first customer of the trivial tour)
+        first = list(range(n+1))            # first and last customer of every route id
+        last = list(range(n+1))
+        succ = [0] * (n+1)                  # successor of every customer, 0 = depot
+        quantity = [0.0] * (n+1)
+        segment = list(vrpdata.Segments)    # time-window segment of every route (see tw_concat)
+        depot = vrpdata.Segments[0]
+        for c in range(1, n+1):
+            quantity[c] = vrpdata.CustDem[c]
+        m = len(si)
+        alive = [True] * m                  # False if the saving can never be used again
+        merged = [0] * (n+1)                # number of the last merge into every route id, 0 = trivial tour
+        merges = 0
+        head = 0
+        evaluations = 0
+        rejects = 0
         while True:                         # endless loop
-            maxSavings = 0                  # values for best savings decision
-            bestr1 = None
-            bestr2 = None
-            for r1 in self.routes:          # loop through all route combinations
-                for r2 in self.routes:
-                    if r1 != r2:
-                        currentSavings = self.savings2routes(r1,r2)
-                        if currentSavings > maxSavings:     # if the savings are greater than the so far best savings
-                            if random.random() < p:
-                                bestr1 = r1                     # store the routes and the savings value
-                                bestr2 = r2
-                                maxSavings = currentSavings
-            if (bestr1 == None):                          # if no savings or no feasible joins exist break out of the loop
+            best = -1
+            idx = head
+            while idx < m:                  # scan savings in decreasing order
+                if alive[idx]:
+                    evaluations += 1
+                    i = si[idx]; j = sj[idx]
+                    r1 = routeOf[i]; r2 = routeOf[j]
+                    if r1 == r2 or last[r1] != i or first[r2] != j:
+                        alive[idx] = False  # joined or interior customers
+                    elif quantity[r1] + quantity[r2] > vrpdata.MaxVehCap \
+                        or tw_concat(tw_concat(tw_concat(depot, segment[r1], dist[0][first[r1]]), segment[r2], dist[i][j]),
+                                     depot, dist[last[r2]][0])[1] > DELTA_EPS:
+                        alive[idx] = False  # loads and time warp never decrease when routes grow
+                        rejects += 1
+                    elif random.random() < p:
+                        best = idx
+                        break
+                idx += 1
+            while head < m and not alive[head]:
+                head += 1
+            if best == -1:                  # if no savings or no feasible joins exist break out of the loop
                 break
-            newRoute = VRP_Route(bestr1.route+bestr2.route) # generate new route and delete old routes
-            self.routes.remove(bestr1)
-            self.routes.remove(bestr2)
-            self.routes.append(newRoute)
-            self.get_objective()
+            alive[best] = False
+            i = si[best]; j = sj[best]
+            r1 = routeOf[i]; r2 = routeOf[j]
+            succ[i] = j                     # join route r2 to the end of route r1
+            c = j
+            while c != 0:
+                routeOf[c] = r1
+                c = succ[c]
+            last[r1] = last[r2]
+            quantity[r1] += quantity[r2]
+            segment[r1] = tw_concat(segment[r1], segment[r2], dist[i][j])
+            merges += 1
+            merged[r1] = merges
+        self.metrics["savings_algorithm"]["accepted"] += merges
+        self.metrics["savings_algorithm"]["evaluated"] += evaluations
+        self.metrics["savings_algorithm"]["feasibilityRejects"] += rejects
+        routes = []
+        ids = sorted((c for c in range(1, n+1) if routeOf[c] == c), key=lambda c: (merged[c], c))
+        for c in ids:                       # trivial tours first, then the merged routes in the order of their last merge
+            route = []
+            k = c
+            while k != 0:
+                route.append(k)
+                k = succ[k]
+            routes.append(VRP_Route(route))
+        self.set_routes(routes)
+        self.get_objective()
         return self.objective
 
-    def relocate(self, p, p2, t = True):
+    def evaluate_exact(self, route):
+        """Evaluate a route by walking it.
+        Returns distance and tourValid of the customer list route. Used when a delta evaluation is too close to a tie
+        to decide it reliably."""
+        newRoute = VRP_Route(route)
+        newRoute.update_route(self.vrpdata)
+        return newRoute.distance, newRoute.tourValid
+
+    def relocate_delta(self, r, myCopy, item, i, k):
+        """Evaluate a relocate move in O(1).
+        Customer item is taken from position i of route r (myCopy is r.route without it) and inserted at position k.
+        Returns the distance of the new route without building it."""
+        dist = self.vrpdata.DistMatrix
+        n = len(r.route)
+        a = r.route[i-1] if i > 0 else 0            # neighbours of the removed customer
+        b = r.route[i+1] if i < n-1 else 0
+        x = myCopy[k-1] if k > 0 else 0             # neighbours of the insertion position
+        y = myCopy[k] if k < n-1 else 0
+        delta = dist[a][b] - dist[a][item] - dist[item][b] + dist[x][item] + dist[item][y] - dist[x][y]
+        if abs(delta) < DELTA_EPS:
+            return self.evaluate_exact(myCopy[0:k] + [item] + myCopy[k:])[0]
+        return r.distance + delta
+
+    def segment(self, route, a, b, reverse=False):
+        """Time-window segment of route[a..b] (visited in reverse order if reverse is True)."""
+        dist = self.vrpdata.DistMatrix
+        segments = self.vrpdata.Segments
+        if reverse:
+            seg = segments[route[b]]
+            for pos in range(b-1, a-1, -1):
+                seg = tw_concat(seg, segments[route[pos]], dist[route[pos+1]][route[pos]])
+        else:
+            seg = segments[route[a]]
+            for pos in range(a+1, b+1):
+                seg = tw_concat(seg, segments[route[pos]], dist[route[pos-1]][route[pos]])
+        return seg
+
+    def relocate_middles(self, r, i):
+        """Time-window segments of the customers passed over by relocate moves of position i.
+        Entry k holds the segment of r.route[k..i-1] for k < i and of r.route[i+1..k] for k > i. Computing all of them
+        takes O(len) time, so every relocate_valid check of position i is O(1)."""
+        dist = self.vrpdata.DistMatrix
+        segments = self.vrpdata.Segments
+        route = r.route
+        middles = [None] * len(route)
+        for k in range(i-1, -1, -1):
+            middles[k] = segments[route[k]] if k == i-1 else tw_concat(segments[route[k]], middles[k+1], dist[route[k]][route[k+1]])
+        for k in range(i+1, len(route)):
+            middles[k] = segments[route[k]] if k == i+1 else tw_concat(middles[k-1], segments[route[k]], dist[route[k-1]][route[k]])
+        return middles
+
+    def relocate_valid(self, r, i, k, middles=None, operator="relocate"):
+        """Check a relocate move of route r from position i to position k (see relocate_delta).
+        O(1) with the segments from relocate_middles, otherwise the passed-over customers are walked. Rejects are
+        counted in the metrics of operator."""
+        vrpdata = self.vrpdata
+        if r.quantity > vrpdata.MaxVehCap:
+            self.metrics[operator]["feasibilityRejects"] += 1
+            return False
+        dist = vrpdata.DistMatrix
+        depot = vrpdata.Segments[0]
+        route = r.route
+        n = len(route)
+        item = route[i]
+        if k < i:
+            middle = middles[k] if middles is not None else self.segment(route, k, i-1)
+            a = route[k-1] if k > 0 else 0
+            b = route[i+1] if i < n-1 else 0
+            seg = tw_concat(r.prefix[k-1] if k > 0 else depot, vrpdata.Segments[item], dist[a][item])
+            seg = tw_concat(seg, middle, dist[item][route[k]])
+            seg = tw_concat(seg, r.suffix[i+1] if i < n-1 else depot, dist[route[i-1]][b])
+        else:
+            middle = middles[k] if middles is not None else self.segment(route, i+1, k)
+            a = route[i-1] if i > 0 else 0
+            b = route[k+1] if k < n-1 else 0
+            seg = tw_concat(r.prefix[i-1] if i > 0 else depot, middle, dist[a][route[i+1]])
+            seg = tw_concat(seg, vrpdata.Segments[item], dist[route[k]][item])
+            seg = tw_concat(seg, r.suffix[k+1] if k < n-1 else depot, dist[item][b])
+        if seg[1] > DELTA_EPS:
+            self.metrics[operator]["feasibilityRejects"] += 1
+            return False
+        return True
+
+    @instrumented
+    def relocate(self, p, p2, t = True, batch = False, granular = False):
+        if batch:                           # evaluate whole neighbourhoods with NumPy
+            return self.relocate_batch(p, p2, t)
         nrRoute = 1
+        evaluations = 0
         for r in self.routes:
             i = 0
             while i <len(r.route):
                 myCopy = r.route.copy()
                 item = myCopy.pop(i)
+                middles = self.relocate_middles(r, i)
+                nbrs = self.vrpdata.NeighbourSets[item]
                 for k in range(0, len(r.route)):
+                    if granular and ((myCopy[k-1] if k > 0 else 0) not in nbrs) and ((myCopy[k] if k < len(myCopy) else 0) not in nbrs):
+                        continue                    # item would not be next to one of its neighbours
                     if i != k:
-                        newRoute = VRP_Route(myCopy[0:k] + [item] + myCopy[k:])
-                        newRoute.update_route(self.vrpdata)
-                        if ((newRoute.distance < r.distance) and (newRoute.tourValid) and (random.random() < p)) \
-                        or ((random.random() < p2) and (newRoute.distance > r.distance) ):
+                        evaluations += 1
+                        distance = self.relocate_delta(r, myCopy, item, i, k)
+                        if ((distance < r.distance) and self.relocate_valid(r, i, k, middles) and (random.random() < p)) \
+                        or ((random.random() < p2) and (distance > r.distance) and self.relocate_valid(r, i, k, middles)):
                             lTab = [r.route[i], k]
-                            if ((lTab not in self.TabuRelocate) and ((lTab not in self.GlobalTabu) or (t != True))):
+                            if not self.is_tabu(self.TabuRelocate, [lTab], t, self.objective + distance - r.distance):
                                 self.TabuRelocate.append([r.route[i], i])
-                                print(newRoute)
-                                loc = self.routes.index(r)
-                                self.routes.remove(r)
-                                self.routes.insert(loc, newRoute)
+                                newRoute = VRP_Route(myCopy[0:k] + [item] + myCopy[k:])
+                                newRoute.update_route(self.vrpdata)
+                                self.set_route(self.routes.index(r), newRoute)
+                                self.objective += newRoute.distance - r.distance
+                                self.accepted("relocate", [newRoute])
                                 i = len(r.route)
                                 break
+                            self.metrics["relocate"]["tabuRejects"] += 1
                 i += 1
             nrRoute += 1
+        self.metrics["relocate"]["evaluated"] += evaluations
 
     def cleare_tabu_relocate(self, n):
-        criticalNumber = n
-        while (len(self.TabuRelocate) > criticalNumber):
-            self.TabuRelocate.remove(self.TabuRelocate[0])
+        self.TabuRelocate.trim(n)
 
-    def exchange(self, p, p2, t = True):
+    def insertion_costs(self, r, c):
+        """Best and second-best insertion of customer c into route r.
+        Returns (cost, pos, cost2, pos2): the added distance and the position of the two cheapest insertions that
+        keep r valid (capacity and time windows), inf and -1 if there are none. The values are cached per route
+        object; set_route and set_routes drop the entries of replaced routes, so a move only invalidates the routes
+        it changes."""
+        entries = self.insertions.get(r)
+        if entries is None:
+            entries = self.insertions[r] = {}
+        values = entries.get(c)
+        if values is not None:
+            return values
+        vrpdata = self.vrpdata
+        dist = vrpdata.DistMatrix
+        depot = vrpdata.Segments[0]
+        segment = vrpdata.Segments[c]
+        cost1, pos1, cost2, pos2 = math.inf, -1, math.inf, -1
+        if r.quantity + vrpdata.CustDem[c] <= vrpdata.MaxVehCap:
+            route = r.route
+            n = len(route)
+            for pos in range(n+1):
+                a = route[pos-1] if pos > 0 else 0
+                b = route[pos] if pos < n else 0
+                cost = dist[a][c] + dist[c][b] - dist[a][b]
+                if cost >= cost2:
+                    continue                # cannot become one of the two best, skip the time-window check
+                seg = tw_concat(r.prefix[pos-1] if pos > 0 else depot, segment, dist[a][c])
+                seg = tw_concat(seg, r.suffix[pos] if pos < n else depot, dist[c][b])
+                if seg[1] > DELTA_EPS:
+                    continue
+                if cost < cost1:
+                    cost1, pos1, cost2, pos2 = cost, pos, cost1, pos1
+                else:
+                    cost2, pos2 = cost, pos
+        values = entries[c] = (cost1, pos1, cost2, pos2)
+        return values
+
+    @instrumented
+    def relocate_inter(self, t = True, granular = True, maxMoves = None):
+        """Move customers between routes with best improvement.
+        Every iteration applies the relocation of a customer into another route that decreases the total distance
+        the most (falling back to the second-best insertion if the best one is tabu), until no improving move is
+        left or maxMoves moves were made. Removal gains are O(1) and insertion costs come from insertion_costs, so
+        after a move only the two changed routes are evaluated again. With granular, a customer is only moved into
+        routes holding one of its nearest neighbours. Emptied routes are removed. Returns the number of moves."""
+        vrpdata = self.vrpdata
+        dist = vrpdata.DistMatrix
+        depot = vrpdata.Segments[0]
+        moves = 0
+        evaluations = 0
+        while maxMoves is None or moves < maxMoves:
+            routeOf = [None] * (vrpdata.NumCust+1)
+            for r in self.routes:
+                for c in r.route:
+                    routeOf[c] = r
+            best = None
+            bestDelta = -DELTA_EPS
+            for r1 in self.routes:
+                route = r1.route
+                n = len(route)
+                for i in range(n):
+                    c = route[i]
+                    a = route[i-1] if i > 0 else 0
+                    b = route[i+1] if i < n-1 else 0
+                    removal = dist[a][c] + dist[c][b] - dist[a][b]
+                    if granular:
+                        targets = dict.fromkeys(routeOf[x] for x in vrpdata.Neighbours[c].tolist())    # deterministic order
+                    else:
+                        targets = self.routes
+                    for r2 in targets:
+                        if r2 is r1:
+                            continue
+                        evaluations += 1
+                        cost1, pos1, cost2, pos2 = self.insertion_costs(r2, c)
+                        for cost, pos in ((cost1, pos1), (cost2, pos2)):
+                            delta = cost - removal
+                            if delta >= bestDelta:
+                                break
+                            if self.is_tabu(self.TabuRelocate, [[c, pos]], t, self.objective + delta):
+                                self.metrics["relocate_inter"]["tabuRejects"] += 1
+                                continue
+                            seg = tw_concat(r1.prefix[i-1] if i > 0 else depot, r1.suffix[i+1] if i < n-1 else depot, dist[a][b])
+                            if seg[1] > DELTA_EPS:
+                                self.metrics["relocate_inter"]["feasibilityRejects"] += 1
+                                break
+                            best = (r1, i, r2, pos)
+                            bestDelta = delta
+                            break
+            if best is None:
+                break
+            r1, i, r2, pos = best
+            c = r1.route[i]
+            self.TabuRelocate.append([c, i])
+            newRoute1 = VRP_Route(r1.route[:i] + r1.route[i+1:])
+            newRoute2 = VRP_Route(r2.route[:pos] + [c] + r2.route[pos:])
+            newRoute1.update_route(vrpdata)
+            newRoute2.update_route(vrpdata)
+            self.set_route(self.routes.index(r2), newRoute2)
+            if len(newRoute1.route) == 0:
+                self.set_routes([r for r in self.routes if r is not r1])
+            else:
+                self.set_route(self.routes.index(r1), newRoute1)
+            self.objective += bestDelta
+            self.accepted("relocate_inter", [newRoute1, newRoute2])
+            moves += 1
+        self.metrics["relocate_inter"]["evaluated"] += evaluations
+        return moves
+
+    @instrumented
+    def relocate_inter_compact(self, granular = True, maxMoves = None):
+        """relocate_inter on a CompactSolution, see CompactSolution.relocate_inter.
+        The moves change only the arrays; afterwards the changed routes are replaced by new VRP_Route objects in one
+        set_routes call, and moveHook and the trace get all of them at once. The CompactSolution is kept in compact
+        and synchronized with the routes on the next call, so routes changed in between are the only ones rebuilt
+        and the insertion costs of the others stay cached. Tabu memories are not used. Returns the number of moves."""
+        if self.compact is None:
+            self.compact = CompactSolution(self.vrpdata, len(self.routes))
+        compact = self.compact
+        compact.sync(self.routes)                                       # rebuilds only the routes changed since the last call
+        moves = compact.relocate_inter(granular, maxMoves, self.metrics["relocate_inter_compact"])
+        if moves == 0:
+            return 0
+        routes = []
+        newRoutes = []
+        delta = 0
+        for r, old in zip(compact.order, self.routes):
+            if r not in compact.changed:
+                routes.append(old)
+                continue
+            delta -= old.distance
+            compact.slotRoutes[r] = None
+            if compact.length[r] > 0:                                   # emptied routes are removed
+                newRoute = VRP_Route(compact.route(r))
+                newRoute.update_route(self.vrpdata)
+                routes.append(newRoute)
+                newRoutes.append(newRoute)
+                delta += newRoute.distance
+                compact.slotRoutes[r] = newRoute
+        self.set_routes(routes)
+        self.objective += delta
+        self.accepted("relocate_inter_compact", newRoutes, moves)
+        return moves
+
+    def replace_delta(self, r, i, c):
+        """Evaluate replacing a customer in O(1).
+        Returns the change in distance of route r if the customer at position i is replaced by customer c."""
+        dist = self.vrpdata.DistMatrix
+        n = len(r.route)
+        old = r.route[i]
+        a = r.route[i-1] if i > 0 else 0
+        b = r.route[i+1] if i < n-1 else 0
+        return dist[a][c] + dist[c][b] - dist[a][old] - dist[old][b]
+
+    def replace_valid(self, r, i, c):
+        """Check in O(1) whether route r stays valid if the customer at position i is replaced by customer c."""
+        vrpdata = self.vrpdata
+        if r.quantity - vrpdata.CustDem[r.route[i]] + vrpdata.CustDem[c] > vrpdata.MaxVehCap:
+            return False
+        dist = vrpdata.DistMatrix
+        depot = vrpdata.Segments[0]
+        n = len(r.route)
+        a = r.route[i-1] if i > 0 else 0
+        b = r.route[i+1] if i < n-1 else 0
+        seg = tw_concat(r.prefix[i-1] if i > 0 else depot, vrpdata.Segments[c], dist[a][c])
+        seg = tw_concat(seg, r.suffix[i+1] if i < n-1 else depot, dist[c][b])
+        return seg[1] <= DELTA_EPS
+
+    def exchange_delta(self, r, i, t, j):
+        """Evaluate an exchange move in O(1).
+        The customers at position i of route r and position j of route t swap places.
+        Returns the distances of both new routes without building them."""
+        delta1 = self.replace_delta(r, i, t.route[j])
+        delta2 = self.replace_delta(t, j, r.route[i])
+        if abs(delta1 + delta2) < DELTA_EPS:
+            return self.evaluate_exact(r.route[:i] + [t.route[j]] + r.route[i+1:])[0], \
+                self.evaluate_exact(t.route[:j] + [r.route[i]] + t.route[j+1:])[0]
+        return r.distance + delta1, t.distance + delta2
+
+    def exchange_valid(self, r, i, t, j, operator="exchange"):
+        """Check an exchange move (see exchange_delta) in O(1); rejects are counted in the metrics of operator."""
+        if self.replace_valid(r, i, t.route[j]) and self.replace_valid(t, j, r.route[i]):
+            return True
+        self.metrics[operator]["feasibilityRejects"] += 1
+        return False
+
+    @instrumented
+    def exchange(self, p, p2, t = True, batch = False, granular = False):
+        if batch:                           # evaluate whole neighbourhoods with NumPy
+            return self.exchange_batch(p, p2, t)
+        if granular:                        # only swaps creating arcs to nearest neighbours
+            return self.exchange_granular(p, p2, t)
         nrRoute1=0
         nrRoute2=0
+        evaluations = 0
         for r in self.routes:
             nrRoute1 += 1
             for i in range(0, len(r.route)):
                 nrRoute2 = 0
                 for t in self.routes:
                     nrRoute2 += 1
-                    myCopy1 = r.route.copy()
-                    item1 = myCopy1.pop(i)
-                    for j in range(0, len(t.route)):
-                        if(nrRoute1 != nrRoute2) and (r.route != t.route):
-                            myCopy2 = t.route.copy()
-                            item2 = myCopy2.pop(j)
-                            newRoute1 = VRP_Route(myCopy1[0:i] + [item2] + myCopy1[i:])
-                            newRoute2 = VRP_Route(myCopy2[0:j] + [item1] + myCopy2[j:])
-                            newRoute1.update_route(self.vrpdata)
-                            newRoute2.update_route(self.vrpdata)
-                            if ((((newRoute1.distance + newRoute2.distance) < (r.distance + t.distance)) and (newRoute1.tourValid) and (newRoute2.tourValid) and (random.random() < p)) \
-                                or ((random.random() < p2) and (newRoute1.distance + newRoute2.distance) > (r.distance + t.distance)) and (newRoute1.tourValid) and (newRoute2.tourValid)):
+                    if(nrRoute1 != nrRoute2) and (r.route != t.route):
+                        for j in range(0, len(t.route)):
+                            evaluations += 1
+                            distance1, distance2 = self.exchange_delta(r, i, t, j)
+                            if ((((distance1 + distance2) < (r.distance + t.distance)) and self.exchange_valid(r, i, t, j) and (random.random() < p)) \
+                                or ((random.random() < p2) and ((distance1 + distance2) > (r.distance + t.distance)) and self.exchange_valid(r, i, t, j))):
                                 lTab1 = [r.route[i], j]
                                 lTab2 = [t.route[j], i]
-                                if ((lTab1 not in self.TabuExchange) and (lTab2 not in self.TabuExchange) and \
-                                    (((lTab1 not in self.GlobalTabu) and (lTab2 not in self.GlobalTabu)) or (t != True))):
+                                if not self.is_tabu(self.TabuExchange, [lTab1, lTab2], t,
+                                                    self.objective + distance1 + distance2 - r.distance - t.distance):
                                     self.TabuExchange.append([r.route[i], i])
                                     self.TabuExchange.append([t.route[j], j])
-                                    print(newRoute1)
-                                    print(newRoute2)
-                                    loc1 = self.routes.index(r)
-                                    loc2 = self.routes.index(t)
-                                    self.routes.remove(r)
-                                    self.routes.remove(t)
-                                    self.routes.insert(loc1, newRoute1)
-                                    self.routes.insert(loc2, newRoute2)
+                                    newRoute1 = VRP_Route(r.route[:i] + [t.route[j]] + r.route[i+1:])
+                                    newRoute2 = VRP_Route(t.route[:j] + [r.route[i]] + t.route[j+1:])
+                                    newRoute1.update_route(self.vrpdata)
+                                    newRoute2.update_route(self.vrpdata)
+                                    self.set_route(self.routes.index(r), newRoute1)
+                                    self.set_route(self.routes.index(t), newRoute2)
+                                    self.objective += newRoute1.distance + newRoute2.distance - r.distance - t.distance
+                                    self.accepted("exchange", [newRoute1, newRoute2])
                                     r = newRoute1
                                     t = newRoute2
                                     break
-                                
+                                self.metrics["exchange"]["tabuRejects"] += 1
+        self.metrics["exchange"]["evaluated"] += evaluations
+
+    def exchange_granular(self, p, p2, t = True):
+        """Granular version of exchange.
+        The customer at position i of a route is only swapped with the neighbours of its predecessor and successor,
+        so every swap creates at least one arc to a nearest neighbour and a pass takes O(n*k) evaluations."""
+        routeOf = [0] * (self.vrpdata.NumCust+1)    # route index and position of every customer
+        posOf = [0] * (self.vrpdata.NumCust+1)
+        for loc, r in enumerate(self.routes):
+            for pos, c in enumerate(r.route):
+                routeOf[c] = loc
+                posOf[c] = pos
+        evaluations = 0
+        for loc1 in range(len(self.routes)):
+            for i in range(len(self.routes[loc1].route)):
+                r = self.routes[loc1]
+                a = r.route[i-1] if i > 0 else 0
+                b = r.route[i+1] if i < len(r.route)-1 else 0
+                seen = set()
+                for c in self.vrpdata.Neighbours[a].tolist() + self.vrpdata.Neighbours[b].tolist():
+                    if c in seen or routeOf[c] == loc1:
+                        continue
+                    seen.add(c)
+                    loc2 = routeOf[c]
+                    s = self.routes[loc2]
+                    j = posOf[c]
+                    evaluations += 1
+                    distance1, distance2 = self.exchange_delta(r, i, s, j)
+                    if (((distance1 + distance2) < (r.distance + s.distance)) and self.exchange_valid(r, i, s, j) and (random.random() < p)) \
+                        or ((random.random() < p2) and ((distance1 + distance2) > (r.distance + s.distance)) and self.exchange_valid(r, i, s, j)):
+                        lTab1 = [r.route[i], j]
+                        lTab2 = [c, i]
+                        if not self.is_tabu(self.TabuExchange, [lTab1, lTab2], t,
+                                            self.objective + distance1 + distance2 - r.distance - s.distance):
+                            self.TabuExchange.append([r.route[i], i])
+                            self.TabuExchange.append([c, j])
+                            newRoute1 = VRP_Route(r.route[:i] + [c] + r.route[i+1:])
+                            newRoute2 = VRP_Route(s.route[:j] + [r.route[i]] + s.route[j+1:])
+                            newRoute1.update_route(self.vrpdata)
+                            newRoute2.update_route(self.vrpdata)
+                            self.set_route(loc1, newRoute1)
+                            self.set_route(loc2, newRoute2)
+                            routeOf[r.route[i]] = loc2
+                            posOf[r.route[i]] = j
+                            routeOf[c] = loc1
+                            posOf[c] = i
+                            self.objective += newRoute1.distance + newRoute2.distance - r.distance - s.distance
+                            self.accepted("exchange", [newRoute1, newRoute2])
+                            break
+                        self.metrics["exchange"]["tabuRejects"] += 1
+        self.metrics["exchange"]["evaluated"] += evaluations
 
     def clear_tabu_exchange(self, n):
-        criticalNumber = n
-        while (len(self.TabuExchange) > criticalNumber):
-            self.TabuExchange.remove(self.TabuExchange[0])
+        self.TabuExchange.trim(n)
+
+    def two_opt_valid(self, r, i, k, reversal=None, operator="two_opt"):
+        """Check a 2-opt move reversing r.route[i+1..k].
+        reversal is the time-window segment of the reversed customers; two_opt extends it by one customer per k, so
+        the check is O(1). Without it the reversed customers are walked. The quantity does not change. Rejects are
+        counted in the metrics of operator."""
+        vrpdata = self.vrpdata
+        if r.quantity > vrpdata.MaxVehCap:
+            self.metrics[operator]["feasibilityRejects"] += 1
+            return False
+        dist = vrpdata.DistMatrix
+        route = r.route
+        if reversal is None:
+            reversal = self.segment(route, i+1, k, reverse=True)
+        seg = tw_concat(r.prefix[i], reversal, dist[route[i]][route[k]])
+        seg = tw_concat(seg, r.suffix[k+1], dist[route[i+1]][route[k+1]])
+        if seg[1] > DELTA_EPS:
+            self.metrics[operator]["feasibilityRejects"] += 1
+            return False
+        return True
 
-    def two_opt(self, p, p2, t = True):
+    @instrumented
+    def two_opt(self, p, p2, t = True, batch = False, granular = False):
+        if batch:                           # evaluate whole neighbourhoods with NumPy
+            return self.two_opt_batch(p, p2, t)
+        evaluations = 0
         for r in self.routes:
             i = 0
             while i < len(r.route) - 3:
+                  reversal = self.vrpdata.Segments[r.route[i+1]]
                   for k in range(i+2, len(r.route)-1):
+                      reversal = tw_concat(self.vrpdata.Segments[r.route[k]], reversal, self.vrpdata.DistMatrix[r.route[k]][r.route[k-1]])
+                      if granular and (r.route[k] not in self.vrpdata.NeighbourSets[r.route[i]]) \
+                         and (r.route[k+1] not in self.vrpdata.NeighbourSets[r.route[i+1]]):
+                          continue
+                      evaluations += 1
                       val1 = self.vrpdata.DistMatrix[r.route[i]][r.route[i+1]] + self.vrpdata.DistMatrix[r.route[k]][r.route[k+1]]
                       val2 = self.vrpdata.DistMatrix[r.route[i]][r.route[k]] + self.vrpdata.DistMatrix[r.route[i+1]][r.route[k+1]]
                       if (((val1>val2) and (random.random() < p)) or ((val1<=val2) and (random.random() < p2))):
                           lTab1 = [r.route[i+1], i+1]
                           lTab2 = [r.route[k], k]
-                          if((lTab1 not in self.TabuTwoOpt) and (lTab2 not in self.TabuTwoOpt) and \
-                             (((lTab1 not in self.GlobalTabu) and (lTab2 not in self.GlobalTabu)) or (t != True))):
-                              
-                              newRoute1 = VRP_Route(r.route[:i+1] + r.route[k:i:-1] + r.route[k+1:])
-                              newRoute1.update_route(self.vrpdata)
-                              if(newRoute1.tourValid):
+                          if not self.is_tabu(self.TabuTwoOpt, [lTab1, lTab2], t, self.objective + val2 - val1):
+                              tourValid = self.two_opt_valid(r, i, k, reversal)
+                              if(tourValid):
                                   self.TabuTwoOpt.append(lTab1)
                                   self.TabuTwoOpt.append(lTab2)
-                                  r.route = r.route[:i+1] + r.route[k:i:-1] + r.route[k+1:]
-                                  r.update_route(self.vrpdata)
+                                  newRoute = VRP_Route(r.route[:i+1] + r.route[k:i:-1] + r.route[k+1:])
+                                  newRoute.update_route(self.vrpdata)
+                                  self.set_route(self.routes.index(r), newRoute)
+                                  self.objective += newRoute.distance - r.distance
+                                  r = newRoute
+                                  self.accepted("two_opt", [r])
                                   break
+                          else:
+                              self.metrics["two_opt"]["tabuRejects"] += 1
                   i += 1
+        self.metrics["two_opt"]["evaluated"] += evaluations
 
     def clear_tabu_two_opt(self, n):
-        criticalNumber = n
-        while (len(self.TabuTwoOpt) > criticalNumber):
-            self.TabuTwoOpt.remove(self.TabuTwoOpt[0])
+        self.TabuTwoOpt.trim(n)
 
     def clear_global_tabu(self, n):
-        criticalNumber = n
-        while (len(self.GlobalTabu) > criticalNumber):
-            self.GlobalTabu.remove(self.GlobalTabu[0])
\ No newline at end of file
+        self.GlobalTabu.trim(n)
+
+    def select_move(self, gain, feasible, p, p2, isAllowed):
+        """Select a move from a gain matrix.
+        Every feasible improving entry is accepted with probability p and every feasible worsening entry with
+        probability p2, as in the loop operators. Returns the index tuple of the accepted entry with the largest
+        gain for which isAllowed is True (not tabu and time-window feasible), or None."""
+        u = self.rng.random(gain.shape)
+        accepted = feasible & (((gain > 0) & (u < p)) | ((gain < 0) & (u < p2)))
+        candidates = np.flatnonzero(accepted)
+        order = candidates[np.argsort(-gain.ravel()[candidates], kind="stable")]
+        for idx in order.tolist():
+            move = tuple(int(m) for m in np.unravel_index(idx, gain.shape))
+            if isAllowed(*move):
+                return move
+        return None
+
+    def relocate_gains(self, r):
+        """Evaluate all relocate moves of route r at once.
+        Returns the gain (distance saved) and the capacity feasibility of moving the customer at position i to
+        position k as two len x len arrays; entries with i == k are infeasible. Time windows are checked only for the
+        selected moves (relocate_valid)."""
+        vrpdata = self.vrpdata
+        dist = vrpdata.DistMatrix
+        n = len(r.route)
+        route = np.array(r.route)
+        ext = np.concatenate(([0], route, [0]))                 # route incl. depot at both ends
+        pos = np.arange(n)
+        removal = dist[ext[:-2], route] + dist[route, ext[2:]] - dist[ext[:-2], ext[2:]]
+        i = pos[:, None]
+        k = pos[None, :]
+        shift = (k > i).astype(int)                             # positions after i move one step forward
+        x = ext[k + shift]
+        y = ext[k + 1 + shift]
+        item = route[:, None]
+        gain = removal[:, None] - (dist[x, item] + dist[item, y] - dist[x, y])
+        feasible = (i != k) & (r.quantity <= vrpdata.MaxVehCap)
+        return gain, feasible
+
+    def relocate_batch(self, p, p2, t = True):
+        """Batched version of relocate.
+        Evaluates all moves of a route with relocate_gains and applies at most one selected move per route."""
+        self.rng = np.random.default_rng(random.getrandbits(64))
+        for loc in range(len(self.routes)):
+            r = self.routes[loc]
+            if len(r.route) < 2:
+                continue
+            gain, feasible = self.relocate_gains(r)
+            self.metrics["relocate"]["evaluated"] += gain.size
+            def isAllowed(i, k):
+                if not self.relocate_valid(r, i, k):
+                    return False
+                if self.is_tabu(self.TabuRelocate, [[r.route[i], k]], t, self.objective - gain[i, k]):
+                    self.metrics["relocate"]["tabuRejects"] += 1
+                    return False
+                return True
+            move = self.select_move(gain, feasible, p, p2, isAllowed)
+            if move is not None:
+                i, k = move
+                myCopy = r.route.copy()
+                item = myCopy.pop(i)
+                self.TabuRelocate.append([item, i])
+                newRoute = VRP_Route(myCopy[0:k] + [item] + myCopy[k:])
+                newRoute.update_route(self.vrpdata)
+                self.set_route(loc, newRoute)
+                self.objective += newRoute.distance - r.distance
+                self.accepted("relocate", [newRoute])
+
+    def exchange_gains(self, r, t):
+        """Evaluate all exchange moves between routes r and t at once.
+        Returns the gain (distance saved) and the capacity feasibility of swapping the customers at position i of r
+        and position j of t as two len(r) x len(t) arrays. Time windows are checked only for the selected moves
+        (exchange_valid)."""
+        vrpdata = self.vrpdata
+        dist = vrpdata.DistMatrix
+        route1 = np.array(r.route)
+        route2 = np.array(t.route)
+        delta = []
+        feasible = np.ones((len(route1), len(route2)), dtype=bool)
+        for route, other, s, transpose in ((route1, route2, r, False), (route2, route1, t, True)):
+            ext = np.concatenate(([0], route, [0]))
+            a = ext[:-2][:, None]
+            b = ext[2:][:, None]
+            old = route[:, None]
+            c = other[None, :]
+            d = dist[a, c] + dist[c, b] - dist[a, old] - dist[old, b]
+            quantity = s.quantity - vrpdata.CustDem[old] + vrpdata.CustDem[c]
+            ok = quantity <= vrpdata.MaxVehCap
+            if transpose:
+                d = d.T
+                ok = ok.T
+            delta.append(d)
+            feasible &= ok
+        return -(delta[0] + delta[1]), feasible
+
+    def exchange_batch(self, p, p2, t = True):
+        """Batched version of exchange.
+        Evaluates all swaps of a route pair with exchange_gains and applies at most one selected move per pair."""
+        self.rng = np.random.default_rng(random.getrandbits(64))
+        for loc1 in range(len(self.routes)):
+            for loc2 in range(loc1+1, len(self.routes)):
+                r = self.routes[loc1]
+                s = self.routes[loc2]
+                if len(r.route) == 0 or len(s.route) == 0:
+                    continue
+                gain, feasible = self.exchange_gains(r, s)
+                self.metrics["exchange"]["evaluated"] += gain.size
+                def isAllowed(i, j):
+                    if not self.exchange_valid(r, i, s, j):
+                        return False
+                    if self.is_tabu(self.TabuExchange, [[r.route[i], j], [s.route[j], i]], t, self.objective - gain[i, j]):
+                        self.metrics["exchange"]["tabuRejects"] += 1
+                        return False
+                    return True
+                move = self.select_move(gain, feasible, p, p2, isAllowed)
+                if move is not None:
+                    i, j = move
+                    self.TabuExchange.append([r.route[i], i])
+                    self.TabuExchange.append([s.route[j], j])
+                    newRoute1 = VRP_Route(r.route[:i] + [s.route[j]] + r.route[i+1:])
+                    newRoute2 = VRP_Route(s.route[:j] + [r.route[i]] + s.route[j+1:])
+                    newRoute1.update_route(self.vrpdata)
+                    newRoute2.update_route(self.vrpdata)
+                    self.set_route(loc1, newRoute1)
+                    self.set_route(loc2, newRoute2)
+                    self.objective += newRoute1.distance + newRoute2.distance - r.distance - s.distance
+                    self.accepted("exchange", [newRoute1, newRoute2])
+
+    def two_opt_gains(self, r):
+        """Evaluate all 2-opt moves of route r at once.
+        Returns the gain val1 - val2 and the capacity feasibility of reversing r.route[i+1..k] as two len x len
+        arrays; only entries with i+2 <= k <= len-2 can be feasible. Time windows are checked only for the selected
+        moves (two_opt_valid)."""
+        vrpdata = self.vrpdata
+        dist = vrpdata.DistMatrix
+        n = len(r.route)
+        route = np.array(r.route)
+        succ = np.append(route[1:], 0)
+        gain = dist[route, succ][:, None] + dist[route, succ][None, :] \
+            - dist[route[:, None], route[None, :]] - dist[succ[:, None], succ[None, :]]
+        i = np.arange(n)[:, None]
+        k = np.arange(n)[None, :]
+        feasible = (k >= i + 2) & (k <= n - 2) & (r.quantity <= vrpdata.MaxVehCap)
+        return gain, feasible
+
+    def two_opt_batch(self, p, p2, t = True):
+        """Batched version of two_opt.
+        Evaluates all moves of a route with two_opt_gains and applies at most one selected move per route."""
+        self.rng = np.random.default_rng(random.getrandbits(64))
+        for loc in range(len(self.routes)):
+            r = self.routes[loc]
+            if len(r.route) < 4:
+                continue
+            gain, feasible = self.two_opt_gains(r)
+            self.metrics["two_opt"]["evaluated"] += gain.size
+            def isAllowed(i, k):
+                if not self.two_opt_valid(r, i, k):
+                    return False
+                if self.is_tabu(self.TabuTwoOpt, [[r.route[i+1], i+1], [r.route[k], k]], t, self.objective - gain[i, k]):
+                    self.metrics["two_opt"]["tabuRejects"] += 1
+                    return False
+                return True
+            move = self.select_move(gain, feasible, p, p2, isAllowed)
+            if move is not None:
+                i, k = move
+                self.TabuTwoOpt.append([r.route[i+1], i+1])
+                self.TabuTwoOpt.append([r.route[k], k])
+                newRoute = VRP_Route(r.route[:i+1] + r.route[k:i:-1] + r.route[k+1:])
+                newRoute.update_route(self.vrpdata)
+                self.set_route(loc, newRoute)
+                self.objective += newRoute.distance - r.distance
+                self.accepted("two_opt", [newRoute])
+
+    def vnd_candidates(self, operator, c, routeOf, posOf):
+        """Generate the improving feasible moves of operator that involve customer c.
+        Yields (delta, move) with the change of the total distance and a move tuple for vnd_routes. Only moves
+        creating an arc between c and one of its nearest neighbours are generated; tabu memories are ignored."""
+        vrpdata = self.vrpdata
+        dist = vrpdata.DistMatrix
+        depot = vrpdata.Segments[0]
+        nbrs = vrpdata.NeighbourSets[c]
+        r = routeOf[c]
+        i = posOf[c]
+        route = r.route
+        n = len(route)
+        a = route[i-1] if i > 0 else 0
+        b = route[i+1] if i < n-1 else 0
+        if operator == "relocate":
+            myCopy = route[:i] + route[i+1:]
+            removal = dist[a][c] + dist[c][b] - dist[a][b]
+            middles = None
+            for k in range(n):
+                x = myCopy[k-1] if k > 0 else 0
+                y = myCopy[k] if k < n-1 else 0
+                if k == i or (x not in nbrs and y not in nbrs):
+                    continue
+                self.metrics["vnd"]["evaluated"] += 1
+                delta = dist[x][c] + dist[c][y] - dist[x][y] - removal
+                if delta < -DELTA_EPS:
+                    if middles is None:
+                        middles = self.relocate_middles(r, i)
+                    if self.relocate_valid(r, i, k, middles, "vnd"):
+                        yield delta, (r, i, k)
+        elif operator == "relocate_inter":
+            removal = dist[a][c] + dist[c][b] - dist[a][b]
+            removable = None
+            for r2 in dict.fromkeys(routeOf[x] for x in vrpdata.Neighbours[c].tolist()):    # deterministic order
+                if r2 is r:
+                    continue
+                self.metrics["vnd"]["evaluated"] += 1
+                cost, pos = self.insertion_costs(r2, c)[:2]
+                delta = cost - removal
+                if delta < -DELTA_EPS:
+                    if removable is None:
+                        seg = tw_concat(r.prefix[i-1] if i > 0 else depot, r.suffix[i+1] if i < n-1 else depot, dist[a][b])
+                        removable = seg[1] <= DELTA_EPS
+                    if removable:
+                        yield delta, (r, i, r2, pos)
+        elif operator == "exchange":
+            for y in nbrs:                  # swap c with a customer next to y, creating the arc (c, y)
+                if y == 0 or routeOf[y] is r:
+                    continue
+                s = routeOf[y]
+                for j in (posOf[y]-1, posOf[y]+1):
+                    if j < 0 or j >= len(s.route):
+                        continue
+                    self.metrics["vnd"]["evaluated"] += 1
+                    delta = self.replace_delta(r, i, s.route[j]) + self.replace_delta(s, j, c)
+                    if delta < -DELTA_EPS and self.exchange_valid(r, i, s, j, "vnd"):
+                        yield delta, (r, i, s, j)
+        elif operator == "two_opt":
+            if i >= n-3:
+                return
+            segments = vrpdata.Segments
+            reversal = segments[route[i+1]]
+            for k in range(i+2, n-1):
+                reversal = tw_concat(segments[route[k]], reversal, dist[route[k]][route[k-1]])
+                if route[k] not in nbrs and route[k+1] not in vrpdata.NeighbourSets[route[i+1]]:
+                    continue
+                self.metrics["vnd"]["evaluated"] += 1
+                delta = dist[c][route[k]] + dist[route[i+1]][route[k+1]] - dist[c][route[i+1]] - dist[route[k]][route[k+1]]
+                if delta < -DELTA_EPS and self.two_opt_valid(r, i, k, reversal, "vnd"):
+                    yield delta, (r, i, k)
+        else:
+            raise ValueError("unknown VND operator " + str(operator))
+
+    def vnd_routes(self, operator, move):
+        """Return the changed routes of a move from vnd_candidates as a list of (old route, new customer list)."""
+        if operator == "relocate":
+            r, i, k = move
+            myCopy = r.route[:i] + r.route[i+1:]
+            return [(r, myCopy[:k] + [r.route[i]] + myCopy[k:])]
+        if operator == "relocate_inter":
+            r, i, s, pos = move
+            return [(r, r.route[:i] + r.route[i+1:]), (s, s.route[:pos] + [r.route[i]] + s.route[pos:])]
+        if operator == "exchange":
+            r, i, s, j = move
+            return [(r, r.route[:i] + [s.route[j]] + r.route[i+1:]), (s, s.route[:j] + [r.route[i]] + s.route[j+1:])]
+        r, i, k = move
+        return [(r, r.route[:i+1] + r.route[k:i:-1] + r.route[k+1:])]
+
+    @instrumented
+    def vnd(self, order = ("relocate", "relocate_inter", "exchange", "two_opt"), strategy = "first", maxMoves = None, deadline = None):
+        """Variable neighbourhood descent with don't-look bits.
+        The operators in order are tried one after the other; after an improving move the descent restarts with
+        the first one and it stops in a local optimum of all of them (or after maxMoves moves, or once the
+        time.perf_counter() value deadline has passed). strategy "first" applies the first improving move found,
+        "best" the best improving move of all active customers. Every operator keeps a don't-look bit per customer
+        that is set when the customer has no improving move and reset when an arc next to the customer changes.
+        Returns the number of moves made."""
+        if strategy not in ("first", "best"):
+            raise ValueError("strategy has to be 'first' or 'best'")
+        n = self.vrpdata.NumCust
+        routeOf = [None] * (n+1)
+        posOf = [0] * (n+1)
+        for r in self.routes:
+            for pos, c in enumerate(r.route):
+                routeOf[c] = r
+                posOf[c] = pos
+        look = {operator: [True] * (n+1) for operator in order}
+        moves = 0
+        k = 0
+        while k < len(order) and (maxMoves is None or moves < maxMoves):
+            if deadline is not None and time.perf_counter() > deadline:
+                break
+            operator = order[k]
+            active = look[operator]
+            best = None
+            bestDelta = -DELTA_EPS
+            for c in range(1, n+1):
+                if not active[c]:
+                    continue
+                found = False
+                for delta, move in self.vnd_candidates(operator, c, routeOf, posOf):
+                    found = True
+                    if delta < bestDelta:
+                        best, bestDelta = move, delta
+                    if strategy == "first":
+                        break
+                if not found:
+                    active[c] = False       # don't look at c again until an arc next to it changes
+                elif strategy == "first":
+                    break
+            if best is None:
+                k += 1
+                continue
+            newRoutes = []
+            for old, customers in self.vnd_routes(operator, best):
+                changed = route_arcs(old.route) ^ route_arcs(customers)
+                for arc in changed:
+                    for c in arc:
+                        if c != 0:
+                            for bits in look.values():
+                                bits[c] = True
+                newRoute = VRP_Route(customers)
+                newRoute.update_route(self.vrpdata)
+                if len(customers) == 0:
+                    self.set_routes([r for r in self.routes if r is not old])
+                else:
+                    self.set_route(self.routes.index(old), newRoute)
+                for pos, c in enumerate(customers):
+                    routeOf[c] = newRoute
+                    posOf[c] = pos
+                newRoutes.append(newRoute)
+            self.objective += bestDelta
+            self.accepted("vnd", newRoutes)
+            moves += 1
+            k = 0
+        self.get_objective()
+        return moves
+
+
+class CompactSolution:
+    """Array-backed representation of a VRP solution.
+
+    Customers are linked by successor and predecessor arrays, so relocate, swap and 2-opt moves change a few
+    entries instead of building new lists and VRP_Route objects. relocate_inter runs a whole descent on the arrays;
+    VRP_Solution.relocate_inter_compact uses it and only converts the changed routes back. Use from_routes/to_routes
+    to convert from and to the VRP_Route view for printing and the other operators."""
+
+    def __init__(self, vrpdata, numRoutes):
+        """Initialize an empty solution with numRoutes route slots.
+        succ, pred(np.ndarray): next and previous customer of every customer, 0 = depot
+        routeOf, pos(np.ndarray): route slot and position within the route of every customer (-1 if unrouted)
+        first, last(np.ndarray): first and last customer of every route slot, 0 if the route is empty
+        length, load, distance(np.ndarray): number of customers, total demand and distance of every route slot
+        prefix, suffix(list): time-window segments (see tw_concat) of depot..customer and customer..depot
+        timeWarp(np.ndarray): time warp of every route slot
+        stale(np.ndarray): route slots whose positions, segments and time warp are outdated, see refresh
+        insertions(list): cached insertion_costs of every route slot, cleared when the slot changes
+        changed(set): route slots changed by a move since the solution was built or synchronized
+        slotRoutes(list): VRP_Route object every slot was built from, None if it changed or is free, see sync
+        order(list): the route slots in the order of the routes they were built from"""
+        n = vrpdata.NumCust
+        self.vrpdata = vrpdata
+        self.succ = np.zeros(n+1, dtype=np.int64)
+        self.pred = np.zeros(n+1, dtype=np.int64)
+        self.routeOf = np.full(n+1, -1, dtype=np.int64)
+        self.pos = np.full(n+1, -1, dtype=np.int64)
+        self.first = np.zeros(numRoutes, dtype=np.int64)
+        self.last = np.zeros(numRoutes, dtype=np.int64)
+        self.length = np.zeros(numRoutes, dtype=np.int64)
+        self.load = np.zeros(numRoutes)
+        self.distance = np.zeros(numRoutes)
+        self.prefix = [None] * (n+1)
+        self.suffix = [None] * (n+1)
+        self.timeWarp = np.zeros(numRoutes)
+        self.stale = np.ones(numRoutes, dtype=bool)
+        self.insertions = [{} for r in range(numRoutes)]
+        self.changed = set()
+        self.slotRoutes = [None] * numRoutes
+        self.order = []
+
+    @classmethod
+    def from_routes(cls, vrpdata, routes):
+        """Build the arrays from a list of VRP_Route objects (or lists of customers) in O(n)."""
+        self = cls(vrpdata, len(routes))
+        for r, route in enumerate(routes):
+            if isinstance(route, VRP_Route):
+                self.slotRoutes[r] = route
+                route = route.route
+            self.assign(r, route)
+        self.order = list(range(len(routes)))
+        self.changed.clear()
+        return self
+
+    @classmethod
+    def from_solution(cls, solution):
+        """Build the arrays from the routes of a VRP_Solution."""
+        return cls.from_routes(solution.vrpdata, solution.routes)
+
+    def assign(self, r, customers):
+        """Make route slot r hold the customers (list) in this order, in O(len(customers))."""
+        dist = self.vrpdata.DistMatrix
+        self.load[r] = 0
+        self.distance[r] = 0
+        last = 0
+        for pos, c in enumerate(customers):
+            self.link(r, last, c)
+            self.routeOf[c] = r
+            self.pos[c] = pos
+            self.load[r] += self.vrpdata.CustDem[c]
+            self.distance[r] += dist[last][c]
+            last = c
+        self.link(r, last, 0)
+        self.distance[r] += dist[last][0]
+        self.length[r] = len(customers)
+        self.touch(r)
+
+    def grow(self, numRoutes):
+        """Add empty route slots until there are numRoutes of them."""
+        extra = numRoutes - len(self.first)
+        if extra <= 0:
+            return
+        for name in ("first", "last", "length", "load", "distance", "timeWarp"):
+            array = getattr(self, name)
+            setattr(self, name, np.concatenate([array, np.zeros(extra, dtype=array.dtype)]))
+        self.stale = np.concatenate([self.stale, np.ones(extra, dtype=bool)])
+        self.insertions += [{} for r in range(extra)]
+        self.slotRoutes += [None] * extra
+
+    def sync(self, routes):
+        """Make the route slots hold routes (list of VRP_Route objects), in this order.
+        Slots whose VRP_Route object is still in routes are kept together with their segments and cached insertions,
+        as the operators never change a route in place; only the slots of new routes are rebuilt. This lets a
+        CompactSolution follow a VRP_Solution across calls in time proportional to the changed routes."""
+        current = set(routes)
+        slotOf = {}
+        free = []
+        for r, route in enumerate(self.slotRoutes):
+            if route is not None and route in current:
+                slotOf[route] = r
+            else:
+                free.append(r)
+        self.grow(len(self.first) + len(routes) - len(slotOf) - len(free))
+        free += range(len(free) + len(slotOf), len(self.first))
+        free.reverse()
+        self.order = []
+        for route in routes:
+            r = slotOf.get(route)
+            if r is None:
+                r = free.pop()
+                self.slotRoutes[r] = route
+                self.assign(r, route.route)
+            self.order.append(r)
+        for r in free:                                      # slots without a route
+            if self.slotRoutes[r] is not None or self.length[r] > 0:
+                self.slotRoutes[r] = None
+                self.assign(r, [])
+        self.changed.clear()
+
+    def route(self, r):
+        """Return the customers of route slot r as a list."""
+        route = []
+        c = int(self.first[r])
+        while c != 0:
+            route.append(c)
+            c = int(self.succ[c])
+        return route
+
+    def to_routes(self):
+        """Return the non-empty routes as updated VRP_Route objects, in the order of the slots in order."""
+        routes = []
+        for r in self.order:
+            if self.length[r] > 0:
+                route = VRP_Route(self.route(r))
+                route.update_route(self.vrpdata)
+                routes.append(route)
+        return routes
+
+    def to_solution(self):
+        """Return a VRP_Solution holding the routes of this solution, with its objective computed."""
+        solution = VRP_Solution(self.vrpdata)
+        solution.routes = self.to_routes()
+        solution.get_objective()
+        return solution
+
+    def objective(self):
+        """Total distance of all routes."""
+        return float(self.distance.sum())
+
+    def link(self, r, a, b):
+        """Make b the successor of a in route slot r; a = 0 makes b the first and b = 0 makes a the last customer."""
+        if a == 0:
+            self.first[r] = b
+        else:
+            self.succ[a] = b
+        if b == 0:
+            self.last[r] = a
+        else:
+            self.pred[b] = a
+
+    def renumber(self, r, c, pos, stop=0):
+        """Set routeOf and pos of customer c and the following customers of route slot r up to stop (excl.),
+        starting with pos."""
+        while c != stop:
+            self.routeOf[c] = r
+            self.pos[c] = pos
+            pos += 1
+            c = self.succ[c]
+
+    def touch(self, r):
+        """Mark route slot r as changed: its segments are recomputed by the next refresh and its insertions dropped."""
+        self.stale[r] = True
+        self.insertions[r].clear()
+        self.changed.add(int(r))
+
+    def refresh(self, r):
+        """Recompute the time-window segments and the time warp of route slot r if a move made them stale."""
+        if not self.stale[r]:
+            return
+        dist = self.vrpdata.DistMatrix
+        segments = self.vrpdata.Segments
+        seg = segments[0]
+        a = 0
+        c = int(self.first[r])
+        while c != 0:
+            seg = tw_concat(seg, segments[c], dist[a][c])
+            self.prefix[c] = seg
+            a = c
+            c = int(self.succ[c])
+        self.timeWarp[r] = tw_concat(seg, segments[0], dist[a][0])[1]
+        seg = segments[0]
+        b = 0
+        c = a
+        while c != 0:
+            seg = tw_concat(segments[c], seg, dist[c][b])
+            self.suffix[c] = seg
+            b = c
+            c = int(self.pred[c])
+        self.stale[r] = False
+
+    def valid(self, r):
+        """Does route slot r meet the vehicle capacity and all time windows?"""
+        self.refresh(r)
+        return self.load[r] <= self.vrpdata.MaxVehCap and self.timeWarp[r] <= DELTA_EPS
+
+    def insertion_costs(self, r, c):
+        """Best and second-best insertion of customer c into route slot r, like VRP_Solution.insertion_costs.
+        Returns (cost, after, cost2, after2): the added distance and the customer c would follow (0 = depot) of the
+        two cheapest insertions that keep r valid, inf and -1 if there are none. Cached until the slot changes."""
+        entries = self.insertions[r]
+        values = entries.get(c)
+        if values is not None:
+            return values
+        vrpdata = self.vrpdata
+        dist = vrpdata.DistMatrix
+        depot = vrpdata.Segments[0]
+        segment = vrpdata.Segments[c]
+        cost1, after1, cost2, after2 = math.inf, -1, math.inf, -1
+        if self.load[r] + vrpdata.CustDem[c] <= vrpdata.MaxVehCap:
+            self.refresh(r)
+            a = 0
+            while True:
+                b = int(self.succ[a]) if a != 0 else int(self.first[r])
+                cost = dist[a][c] + dist[c][b] - dist[a][b]
+                if cost < cost2:
+                    seg = tw_concat(self.prefix[a] if a != 0 else depot, segment, dist[a][c])
+                    seg = tw_concat(seg, self.suffix[b] if b != 0 else depot, dist[c][b])
+                    if seg[1] <= DELTA_EPS:
+                        if cost < cost1:
+                            cost1, after1, cost2, after2 = cost, a, cost1, after1
+                        else:
+                            cost2, after2 = cost, a
+                if b == 0:
+                    break
+                a = b
+        values = entries[c] = (cost1, after1, cost2, after2)
+        return values
+
+    def relocate_inter(self, granular = True, maxMoves = None, metrics = None):
+        """Move customers between routes with best improvement, the array version of VRP_Solution.relocate_inter.
+        Every iteration applies the relocation of a customer into another route that decreases the total distance
+        the most, until no improving move is left or maxMoves moves were made. Tabu memories are not used, as in
+        vnd. With granular, a customer is only moved into routes holding one of its nearest neighbours. Emptied
+        route slots are kept. evaluated and feasibilityRejects are added to metrics (dict, if given).
+        Returns the number of moves."""
+        vrpdata = self.vrpdata
+        dist = vrpdata.DistMatrix
+        depot = vrpdata.Segments[0]
+        slots = self.order
+        moves = 0
+        evaluations = 0
+        rejects = 0
+        while maxMoves is None or moves < maxMoves:
+            best = None
+            bestDelta = -DELTA_EPS
+            for r1 in slots:
+                if self.length[r1] == 0:
+                    continue
+                self.refresh(r1)
+                c = int(self.first[r1])
+                while c != 0:
+                    a = int(self.pred[c])
+                    b = int(self.succ[c])
+                    removal = dist[a][c] + dist[c][b] - dist[a][b]
+                    if granular:
+                        targets = dict.fromkeys(self.routeOf[vrpdata.Neighbours[c]].tolist())    # deterministic order
+                    else:
+                        targets = slots
+                    for r2 in targets:
+                        if r2 == r1 or self.length[r2] == 0:
+                            continue
+                        evaluations += 1
+                        cost, after = self.insertion_costs(r2, c)[:2]
+                        delta = cost - removal
+                        if delta >= bestDelta:
+                            continue
+                        seg = tw_concat(self.prefix[a] if a != 0 else depot, self.suffix[b] if b != 0 else depot, dist[a][b])
+                        if seg[1] > DELTA_EPS:
+                            rejects += 1
+                            continue
+                        best = (c, r2, after)
+                        bestDelta = delta
+                    c = b
+            if best is None:
+                break
+            self.relocate(*best)
+            moves += 1
+        if metrics is not None:
+            metrics["evaluated"] += evaluations
+            metrics["feasibilityRejects"] += rejects
+        return moves
+
+    def relocate(self, c, r, after):
+        """Move customer c behind customer after in route slot r (after = 0 inserts it at the start).
+        O(1) link updates plus renumbering the positions of the changed routes. after has to be a customer of
+        route slot r other than c, otherwise ValueError is raised."""
+        if after == c:
+            raise ValueError("customer " + str(c) + " cannot be moved behind itself")
+        if after != 0 and self.routeOf[after] != r:
+            raise ValueError("customer " + str(after) + " is not in route slot " + str(r))
+        dist = self.vrpdata.DistMatrix
+        dem = self.vrpdata.CustDem[c]
+        r1 = self.routeOf[c]
+        a = self.pred[c]
+        b = self.succ[c]
+        self.link(r1, a, b)                         # take c out of its route
+        self.distance[r1] += dist[a][b] - dist[a][c] - dist[c][b]
+        self.load[r1] -= dem
+        self.length[r1] -= 1
+        y = self.succ[after] if after != 0 else self.first[r]
+        self.link(r, after, c)                      # and insert it between after and y
+        self.link(r, c, y)
+        self.distance[r] += dist[after][c] + dist[c][y] - dist[after][y]
+        self.load[r] += dem
+        self.length[r] += 1
+        if r1 != r:
+            self.renumber(r1, b, self.pos[a] + 1 if a != 0 else 0)
+            self.renumber(r, c, self.pos[after] + 1 if after != 0 else 0)
+            self.touch(r1)
+        else:
+            self.renumber(r, self.first[r], 0)
+        self.touch(r)
+
+    def swap(self, a, b):
+        """Exchange the customers a and b, within a route or between two routes, in O(1)."""
+        if self.succ[b] == a and self.routeOf[a] == self.routeOf[b]:
+            a, b = b, a
+        dist = self.vrpdata.DistMatrix
+        ra = self.routeOf[a]
+        rb = self.routeOf[b]
+        pa, sa = self.pred[a], self.succ[a]
+        pb, sb = self.pred[b], self.succ[b]
+        if ra == rb and sa == b:                    # adjacent: pa a b sb -> pa b a sb
+            self.distance[ra] += dist[pa][b] + dist[a][sb] - dist[pa][a] - dist[b][sb]
+            self.link(ra, pa, b)
+            self.link(ra, b, a)
+            self.link(ra, a, sb)
+        else:
+            self.distance[ra] += dist[pa][b] + dist[b][sa] - dist[pa][a] - dist[a][sa]
+            self.distance[rb] += dist[pb][a] + dist[a][sb] - dist[pb][b] - dist[b][sb]
+            self.link(ra, pa, b)
+            self.link(ra, b, sa)
+            self.link(rb, pb, a)
+            self.link(rb, a, sb)
+            dem = self.vrpdata.CustDem[a] - self.vrpdata.CustDem[b]
+            self.load[ra] -= dem
+            self.load[rb] += dem
+        self.routeOf[a], self.routeOf[b] = rb, ra
+        self.pos[a], self.pos[b] = self.pos[b], self.pos[a]
+        self.touch(ra)
+        self.touch(rb)
+
+    def two_opt(self, a, b):
+        """Reverse the part of a route from customer a to customer b (pos[a] < pos[b]).
+        O(length of the reversed part); the distance matrix has to be symmetric."""
+        dist = self.vrpdata.DistMatrix
+        r = self.routeOf[a]
+        p = self.pred[a]
+        s = self.succ[b]
+        self.distance[r] += dist[p][b] + dist[a][s] - dist[p][a] - dist[b][s]
+        pos = self.pos[a]
+        c = a
+        while c != s:                               # swap the links of the reversed customers
+            nxt = self.succ[c]
+            self.succ[c], self.pred[c] = self.pred[c], nxt
+            c = nxt
+        self.link(r, p, b)
+        self.link(r, a, s)
+        self.renumber(r, b, pos, s)
+        self.touch(r)
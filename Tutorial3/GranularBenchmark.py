@@ -0,0 +1,36 @@
+import CW_Savings
+import random
+import time
+
+files = ["solomon_50/C101.txt", "solomon_50/R101.txt", "solomon_100/C101.txt", "solomon_100/R101.txt", "solomon_100/RC101.txt"]
+neighbours = [5, 10, 20, None]                                      # None = full neighbourhoods
+iterations = 20                                                     # relocate/exchange/two_opt rounds per run
+seed = 0
+
+def run(vrpdata, granular):
+    """Run savings and the local search rounds with a fixed seed.
+    Returns the total distance, whether the solution is valid and the time spent in the local search."""
+    random.seed(seed)
+    mySolution = CW_Savings.VRP_Solution(vrpdata)
+    mySolution.savings_algorithm(1)
+    start = time.perf_counter()
+    for j in range(0, iterations):
+        mySolution.relocate(0.7, 0.001, True, granular=granular)
+        mySolution.exchange(0.7, 0.000001, True, granular=granular)
+        mySolution.two_opt(0.7, 0.001, True, granular=granular)
+        mySolution.get_objective()
+        mySolution.cleare_tabu_relocate(0)
+        mySolution.clear_tabu_exchange(0)
+        mySolution.clear_tabu_two_opt(0)
+    elapsed = time.perf_counter() - start
+    mySolution.get_objective()
+    return mySolution.objective, mySolution.solutionValid, elapsed
+
+if __name__ == "__main__":
+    print("instance".ljust(22) + "k".rjust(6) + "distance".rjust(12) + "valid".rjust(7) + "time [s]".rjust(10))
+    for file in files:
+        for k in neighbours:
+            myVRP = CW_Savings.VRP(file) if k is None else CW_Savings.VRP(file, k=k)   # a fresh route cache for every k
+            distance, valid, elapsed = run(myVRP, k is not None)
+            print(file.ljust(22) + ("all" if k is None else str(k)).rjust(6) + str(round(distance, 2)).rjust(12) + str(valid).rjust(7)
+                  + str(round(elapsed, 3)).rjust(10))
@@ -0,0 +1,145 @@
+import CW_Savings
+import LocalSeatch
+import Runner
+import argparse
+import multiprocessing
+import queue
+import time
+import numpy as np
+
+def encode(snapshot):
+    """Serialize a solution snapshot (tuple of customer tuples) into one integer array, routes separated by 0."""
+    flat = [0]
+    for route in snapshot:
+        flat.extend(route)
+        flat.append(0)
+    return np.array(flat, dtype=np.int32)
+
+def decode(array):
+    """Inverse of encode: return the tuple of customer tuples stored in array."""
+    routes = []
+    route = []
+    for c in array[1:].tolist():
+        if c == 0:
+            routes.append(tuple(route))
+            route = []
+        else:
+            route.append(c)
+    return tuple(routes)
+
+def island(index, file, seed, params, interval, deadline, inbox, outbox, results, cache):
+    """Run the local search of one island until deadline (a time.time() value).
+    Every interval iterations the island sends its best solution to outbox if it improved since the last migration
+    and adopts the best solution received in inbox if that is better than its current one. The final result is put
+    into results, or an entry with the error if the search failed."""
+    outbox.cancel_join_thread()                                     # do not block at exit on unread migrants
+    sent = -1
+    accepted = 0
+
+    def migrate(mySolution, run, iteration, best):
+        nonlocal sent, accepted
+        if (iteration + 1) % interval != 0:
+            return False
+        if best is not None and (sent == -1 or best[0] < sent):
+            sent = best[0]
+            outbox.put((sent, encode(best[1])))
+        migrant = None
+        while True:
+            try:
+                received = inbox.get_nowait()
+            except queue.Empty:
+                break
+            if migrant is None or received[0] < migrant[0]:
+                migrant = received
+        if migrant is not None and (not mySolution.solutionValid or migrant[0] < mySolution.objective - CW_Savings.DELTA_EPS):
+            mySolution.restore(decode(migrant[1]))
+            accepted += 1
+            return True                                             # solve checks whether it is a new best solution
+        return False
+
+    try:
+        Runner.init_worker(cache)
+        myVRP = Runner.load_instance(file)
+        localDeadline = time.perf_counter() + max(0.0, deadline - time.time())
+        mySolution, bestObjectiv, timedOut = LocalSeatch.solve(myVRP, seed=seed, runs=1, iterations=10**9,
+                                                               deadline=localDeadline, iterationHook=migrate,
+                                                               **Runner.parameterSets[params])
+        results.put({"island": index, "seed": seed, "params": params, "objective": bestObjectiv,
+                     "routes": encode(mySolution.snapshot()), "migrantsAccepted": accepted, "metrics": mySolution.metrics_dict()})
+    except Exception as error:
+        results.put({"island": index, "seed": seed, "params": params, "objective": -1, "error": repr(error)})
+
+def run(file, islands=4, budget=60.0, interval=10, params=("default",), seed=0, cache=None, grace=10.0):
+    """Solve one instance with an island model.
+    islands(int): number of worker processes, island i uses seed + i and the parameter set params[i % len(params)]
+    budget(float): wall time in seconds for the whole search
+    grace(float): seconds after budget until islands that have not reported are terminated and recorded as timed out
+    interval(int): iterations between two migrations; solutions move along a ring of islands
+    Returns the best solution (VRP_Solution), its objective (or -1) and the results of all islands."""
+    if cache is not None:
+        CW_Savings.VRP(file, cachedir=cache)
+    deadline = time.time() + budget
+    queues = [multiprocessing.Queue() for i in range(islands)]
+    results = multiprocessing.Queue()
+    processes = []
+    for i in range(islands):
+        process = multiprocessing.Process(target=island, args=(i, file, seed + i, params[i % len(params)], interval,
+                                                               deadline, queues[i], queues[(i + 1) % islands], results, cache))
+        process.start()
+        processes.append(process)
+    islandResults = []
+    while len(islandResults) < islands:
+        try:
+            islandResults.append(results.get(timeout=max(0.0, min(1.0, deadline + grace - time.time()))))
+        except queue.Empty:
+            if all(process.exitcode is not None for process in processes) and results.empty():
+                break                                               # an island died without reporting
+            if time.time() > deadline + grace:
+                break                                               # an iteration ran far past the budget
+    reported = set(r["island"] for r in islandResults)
+    for i, process in enumerate(processes):
+        if i not in reported and process.is_alive():
+            process.terminate()
+            process.join()
+            islandResults.append({"island": i, "seed": seed + i, "params": params[i % len(params)], "objective": -1,
+                                  "error": "timed out", "timedOut": True})
+        else:
+            process.join()
+            if i not in reported:
+                islandResults.append({"island": i, "seed": seed + i, "params": params[i % len(params)], "objective": -1,
+                                      "error": "exit code " + str(process.exitcode)})
+    islandResults.sort(key=lambda r: r["island"])
+    finished = [r for r in islandResults if "error" not in r]
+    if not finished:
+        raise RuntimeError("all islands failed: " + "; ".join(r["error"] for r in islandResults))
+    valid = [r for r in finished if r["objective"] != -1]
+    best = min(valid or finished, key=lambda r: r["objective"] if r["objective"] != -1 else float("inf"))
+    bestSolution = CW_Savings.VRP_Solution(CW_Savings.VRP(file, cachedir=cache))
+    bestSolution.restore(decode(best["routes"]))
+    return bestSolution, best["objective"], islandResults
+
+if __name__ == "__main__":
+    iterative = sorted(name for name, values in Runner.parameterSets.items() if "vnd" not in values)
+    parser = argparse.ArgumentParser(description="Solve one instance with parallel islands exchanging their best solutions.")
+    parser.add_argument("file")
+    parser.add_argument("--islands", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--time", type=float, default=60.0, help="global time budget in seconds")
+    parser.add_argument("--interval", type=int, default=10, help="iterations between migrations")
+    parser.add_argument("--params", nargs="+", default=["default"], choices=iterative, help="parameter sets, cycled over the islands")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first island, island i uses seed + i")
+    parser.add_argument("--cache", default=None, help="directory for binary instance caches")
+    parser.add_argument("--grace", type=float, default=10.0, help="seconds after --time until unfinished islands are terminated")
+    args = parser.parse_args()
+
+    bestSolution, bestObjectiv, islandResults = run(args.file, args.islands, args.time, args.interval, args.params, args.seed,
+                                                    args.cache, args.grace)
+    for result in islandResults:
+        if "error" in result:
+            print("island " + str(result["island"]) + " [" + result["params"] + "] seed " + str(result["seed"]) + " failed: "
+                  + result["error"])
+            continue
+        print("island " + str(result["island"]) + " [" + result["params"] + "] seed " + str(result["seed"]) + ": "
+              + str(round(result["objective"], 2)) + ", " + str(result["migrantsAccepted"]) + " migrants accepted")
+    print("_______________________________________________________ BEST: _______________________________________________________")
+    print(bestSolution)
+    print(args.file + ": " + str(bestObjectiv))
@@ -0,0 +1,73 @@
+import CW_Savings
+import argparse
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+
+def write_instance(filename, numCust, seed=0):
+    """Write a random instance with numCust customers in Solomon format.
+    Customers are uniform in a 1000 x 1000 square with the depot in the middle; the time windows do not bind."""
+    rng = np.random.default_rng(seed)
+    coord = rng.uniform(0, 1000, (numCust+1, 2))
+    coord[0] = [500, 500]
+    demand = rng.integers(1, 31, numCust+1)
+    demand[0] = 0
+    with open(filename, "w") as fp:
+        fp.write("RND" + str(numCust) + "\n\nVEHICLE\nNUMBER     CAPACITY\n")
+        fp.write("  " + str(numCust) + "         200\n\nCUSTOMER\n")
+        fp.write("CUST NO.  XCOORD.   YCOORD.    DEMAND   READY TIME  DUE DATE   SERVICE   TIME\n \n")
+        for c in range(numCust+1):
+            fp.write("%5d %10.2f %10.2f %6d %10d %10d %10d\n" % (c, coord[c, 0], coord[c, 1], demand[c], 0, 10**9, 0 if c == 0 else 10))
+
+def measure(function, trace):
+    """Run function and return its result and either its run time or, if trace is True, its peak traced memory.
+    Time and memory are measured in separate runs because tracemalloc slows down the allocation of Python objects."""
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    if trace:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return result, peak
+    return result, elapsed
+
+def run(filename, dense, trace):
+    """Load an instance, build the savings solution and do one round of local search.
+    Returns a list of (step, time or peak memory) tuples and the final objective."""
+    steps = []
+    myVRP, value = measure(lambda: CW_Savings.VRP(filename, dense=dense), trace)
+    steps.append(("load", value))
+    mySolution = CW_Savings.VRP_Solution(myVRP)
+    objective, value = measure(lambda: mySolution.savings_algorithm(1), trace)
+    steps.append(("savings", value))
+    for name, operator in (("relocate", lambda: mySolution.relocate(0.7, 0.001)),
+                           ("exchange (granular)", lambda: mySolution.exchange(0.7, 0.000001, granular=True)),
+                           ("two_opt", lambda: mySolution.two_opt(0.7, 0.001))):
+        result, value = measure(operator, trace)
+        steps.append((name, value))
+    return steps, mySolution.get_objective()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report run time and peak memory on synthetic large instances.")
+    parser.add_argument("sizes", nargs="*", type=int, default=[1000, 5000, 10000])
+    parser.add_argument("--dense-limit", type=int, default=1000, help="also run with the dense matrix up to this size")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for numCust in args.sizes:
+            filename = os.path.join(tmp, "RND" + str(numCust) + ".txt")
+            write_instance(filename, numCust)
+            for dense in ([True, False] if numCust <= args.dense_limit else [False]):
+                random.seed(0)
+                times, objective = run(filename, dense, False)
+                random.seed(0)
+                peaks, objective = run(filename, dense, True)
+                print(str(numCust) + " customers, " + ("dense matrix" if dense else "distances on demand")
+                      + ", objective " + str(round(objective, 1)))
+                for (step, elapsed), (step, peak) in zip(times, peaks):
+                    print("  " + step.ljust(22) + str(round(elapsed, 3)).rjust(9) + " s" + str(round(peak / 2**20, 1)).rjust(10) + " MB peak")
@@ -1,75 +1,225 @@
 import CW_Savings
-import csv
+import argparse
+import json
+import os
+import random
+import time
 
 files25 = ["solomon_25//C101.txt", "solomon_25/C201.txt", "solomon_25/R101.txt", "solomon_25/R201.txt", "solomon_25/RC101.txt", "solomon_25/RC201.txt"]
 files50 = ["solomon_50/C101.txt", "solomon_50/C201.txt", "solomon_50/R101.txt", "solomon_50/R201.txt", "solomon_50/RC101.txt", "solomon_50/RC201.txt"]
 files100 = ["solomon_100/C101.txt", "solomon_100/C201.txt", "solomon_100/R101.txt", "solomon_100/R201.txt", "solomon_100/RC101.txt", "solomon_100/RC201.txt"]
 folders = [files25, files50, files100]
-bestSolutions = []
 
-for folder in folders:
-    for file in folder:
-        myVRP = CW_Savings.VRP(file)
-        mySolution = CW_Savings.VRP_Solution(myVRP)
-        bestSolution = mySolution
-        bestObjectiv = 0
-        k = 0
-        csvName = file[:-4] + ".csv"
-        with open(csvName, 'w', newline='') as fp:
-            a = csv.writer(fp, delimiter=',')
+def write_checkpoint(path, data):
+    """Write a checkpoint (dict) to a JSON file; the old file is replaced only once the new one is complete."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".tmp", "w") as fp:
+        json.dump(data, fp)
+    os.replace(path + ".tmp", path)
+
+def read_checkpoint(path):
+    """Return the checkpoint stored in path, or None if there is none."""
+    if not os.path.exists(path):
+        return None
+    with open(path) as fp:
+        return json.load(fp)
+
+def solve(myVRP, seed=None, runs=2, iterations=50, relocate=(0.7, 0.001), exchange=(0.7, 0.000001), twoOpt=(0.7, 0.001),
+          trace=None, deadline=None, moveHook=None, iterationHook=None, interRoute=False,
+          vnd=None, timeLimit=None, stagnation=None, checkpoint=None, checkpointInterval=10.0, tenure=None,
+          aspiration=False, journalLimit=1000):
+    """Run the savings algorithm followed by the tabu local search.
+    myVRP(VRP): instance to solve
+    seed(int): seed for the random numbers, None keeps the current state
+    runs(int): how many times the savings algorithm and the local search are run
+    iterations(int): how many rounds of relocate, exchange and two_opt are done per run
+    relocate, exchange, twoOpt(tuple): (p, p2) of the operators
+    trace(CW_Savings.Trace): records a point after every step and prints according to its level (default=None)
+    deadline(float): time.perf_counter() value after which the search stops (default=None)
+    moveHook(callable): called as moveHook(operator, solution, routes) after every accepted move (default=None)
+    iterationHook(callable): called as iterationHook(solution, run, iteration, best) after every iteration, best is
+    (objective, snapshot) of the best valid solution or None. If it replaced the solution (e.g. by restore) it returns
+    True and the new solution becomes a candidate for the best one (default=None)
+    interRoute(bool or str): also move customers between routes with relocate_inter after relocate; "compact" runs
+    relocate_inter_compact instead, the same descent on a CompactSolution without tabu memories (default=False)
+    vnd(str): "first" or "best" replaces the fixed iterations by a variable neighbourhood descent with this strategy
+    that stops in a local optimum or at the deadline; stagnation counts one descent as one iteration (default=None)
+    timeLimit(float): seconds after which the search stops, combined with deadline (default=None)
+    stagnation(int): stop after this many iterations without a new best valid solution (default=None)
+    checkpoint(str): JSON file the best solution (the current one while none is valid) is written to every
+    checkpointInterval seconds and at the end. If it exists, the search resumes from its solution, run and iteration
+    instead of starting over (default=None)
+    tenure(int): iterations a move stays tabu (default=None: until the memories are cleared)
+    aspiration(bool): allow tabu moves that lead to a new best valid objective (default=False)
+    journalLimit(int): undo entries kept since the best solution; beyond that the journal is dropped and the best
+    solution is kept as a snapshot instead, so long runs without improvement do not hold every replaced route
+    (default=1000)
+    Returns the best valid solution found (the last one if none was valid), its objective (or -1) and whether the
+    deadline was reached."""
+    if seed is not None:
+        random.seed(seed)
+    mySolution = CW_Savings.VRP_Solution(myVRP, tenure, aspiration)
+    mySolution.moveHook = moveHook
+    mySolution.iterationHook = iterationHook
+    mySolution.trace = trace
+    mySolution.mark()                                                   # journal the moves made since the best solution
+    bestObjectiv = -1
+    timedOut = False
+    if timeLimit is not None:
+        deadline = min(deadline, time.perf_counter() + timeLimit) if deadline is not None else time.perf_counter() + timeLimit
+    sinceImprovement = 0
+    incumbent = None                                                    # snapshot of the best solution for checkpoints, hooks and
+                                                                        # searches whose journal was dropped
+    lastCheckpoint = time.perf_counter()
+    resume = read_checkpoint(checkpoint) if checkpoint is not None else None
+    if resume is not None and resume["instance"] != myVRP.InstanceFile:
+        raise ValueError(checkpoint + " is a checkpoint of " + resume["instance"])
 
-            for i in range(0, 2):                                          # How many times run program
-                k += 1
-                print("-------------------------------------")
-                mySolution.savings_algorithm(1)
-                a.writerows([[k, str(mySolution.objective)]])
-                print(mySolution)
-                print("-------------------------------------")
-                for j in range(0, 50):                                     # how many iteration of alghoritms we will do in program
-                    for m in range(0, 1):                                  # how many iteration of relocate function
-                        k += 1
-                        mySolution.relocate(0.7, 0.001, True)
-                        mySolution.get_objective()
-                        mySolution.GlobalTabu += mySolution.TabuRelocate
-                        mySolution.cleare_tabu_relocate(0)                  
-                        mySolution.clear_global_tabu(1000000)               
-                        print(mySolution)
-                        a.writerows([[k, str(mySolution.objective)]])
-                        if(bestObjectiv > mySolution.objective):            # If actual solution is best solution then add to best Solution
-                            bestObjectiv = mySolution.objective
-                            bestSolution = mySolution
-                    for n in range(0, 1):                                   # how many iteration of exchange function
-                        k += 1
-                        mySolution.exchange(0.7, 0.000001, True)
-                        mySolution.get_objective()
-                        mySolution.GlobalTabu += mySolution.TabuRelocate
-                        mySolution.clear_tabu_exchange(0)
-                        mySolution.clear_global_tabu(1000000)               
-                        print(mySolution)
-                        a.writerows([[k, str(mySolution.objective)]])
-                        if(bestObjectiv > mySolution.objective):            # If actual solution is best solution then add to best Solution
-                            bestObjectiv = mySolution.objective
-                            bestSolution = mySolution
-                    for o in range(0, 1):                                   # how many iteration of two_opt function
-                        k += 1
-                        mySolution.two_opt(0.7, 0.001, True)
-                        mySolution.get_objective()
-                        mySolution.GlobalTabu += mySolution.TabuRelocate    
-                        mySolution.clear_tabu_two_opt(0)
-                        mySolution.clear_global_tabu(1000000)               
-                        print(mySolution)
-                        a.writerows([[k, str(mySolution.objective)]])
-                        if(bestObjectiv > mySolution.objective):            # If actual solution is best solution then add to best Solution 
-                            bestObjectiv = mySolution.objective
-                            bestSolution = mySolution
-            bestSolutions.append(bestSolution)
+    def step(operator, run, iteration):
+        nonlocal bestObjectiv, sinceImprovement, incumbent
+        if mySolution.journal is not None and len(mySolution.journal) > journalLimit:
+            if bestObjectiv != -1 and incumbent is None:
+                incumbent = mySolution.committed_snapshot()
+            mySolution.journal = None                                   # keep only snapshots from now on
+        if trace is not None:
+            trace.point(run, iteration, operator, mySolution.objective)
+            if trace.level >= CW_Savings.SOLUTIONS:
+                trace.message(CW_Savings.SOLUTIONS, mySolution)
+        if mySolution.solutionValid and (bestObjectiv == -1 or bestObjectiv > mySolution.objective):    # If actual solution is best solution
+            bestObjectiv = mySolution.objective
+            mySolution.commit()
+            sinceImprovement = 0
+            if trace is not None:
+                trace.message(CW_Savings.PROGRESS, "run " + str(run) + " iteration " + str(iteration) + " " + operator
+                              + ": " + str(round(bestObjectiv, 5)))
+            if checkpoint is not None or iterationHook is not None or mySolution.journal is None:
+                incumbent = mySolution.snapshot()
 
-print("_______________________________________________________ SOLUTIONS: _______________________________________________________")
-for i in bestSolutions:
-    print(i.vrpdata.InstanceFile + ": " + str(i.objective))
-    #print(i)
+    def save(run, iteration):                                           # iteration is the next one to run
+        nonlocal lastCheckpoint
+        lastCheckpoint = time.perf_counter()
+        routes = incumbent if incumbent is not None else mySolution.snapshot()   # the current solution until one is valid
+        write_checkpoint(checkpoint, {"instance": myVRP.InstanceFile, "objective": bestObjectiv, "valid": incumbent is not None,
+                                      "routes": [list(route) for route in routes], "run": run, "iteration": iteration})
 
+    if resume is not None and resume["run"] >= runs:                    # the checkpointed search was finished
+        mySolution.restore(resume["routes"])
+        step("checkpoint", resume["run"], resume["iteration"])
+    for i in range(0, runs):                                            # How many times run program
+        if resume is not None and i < resume["run"]:
+            continue                                                    # finished before the checkpoint
+        if deadline is not None and time.perf_counter() > deadline:
+            timedOut = True
+            stopped = (i, 0)
+            break
+        if trace is not None:
+            trace.message(CW_Savings.SOLUTIONS, "-------------------------------------")
+        first = 0
+        if resume is not None:
+            mySolution.restore(resume["routes"])
+            first = resume["iteration"]
+            resume = None
+            step("checkpoint", i, first)
+        else:
+            mySolution.savings_algorithm(1)
+            step("savings_algorithm", i, first)
+        if trace is not None:
+            trace.message(CW_Savings.SOLUTIONS, "-------------------------------------")
+        if vnd is not None:
+            sinceImprovement += 1                                       # a descent counts as one iteration
+            mySolution.vnd(strategy=vnd, deadline=deadline)
+            step("vnd", i, first)
+            if deadline is not None and time.perf_counter() > deadline:
+                timedOut = True
+                stopped = (i, 0)                                        # the descent continues from the checkpoint
+        else:
+            for j in range(first, iterations):                          # how many iteration of alghoritms we will do in program
+                if deadline is not None and time.perf_counter() > deadline:
+                    timedOut = True
+                    stopped = (i, j)
+                    break
+                if stagnation is not None and sinceImprovement >= stagnation:
+                    break
+                sinceImprovement += 1
+                mySolution.relocate(*relocate, True)
+                mySolution.get_objective()
+                mySolution.GlobalTabu += mySolution.TabuRelocate
+                mySolution.cleare_tabu_relocate(0)
+                mySolution.clear_global_tabu(1000000)
+                step("relocate", i, j)
+                if interRoute == "compact":
+                    mySolution.relocate_inter_compact()
+                    mySolution.get_objective()
+                    step("relocate_inter_compact", i, j)
+                elif interRoute:
+                    mySolution.relocate_inter(True)
+                    mySolution.get_objective()
+                    mySolution.GlobalTabu += mySolution.TabuRelocate
+                    mySolution.cleare_tabu_relocate(0)              # inter-route positions must not reach the next relocate
+                    mySolution.clear_global_tabu(1000000)
+                    step("relocate_inter", i, j)
+                mySolution.exchange(*exchange, True)
+                mySolution.get_objective()
+                mySolution.GlobalTabu += mySolution.TabuRelocate
+                mySolution.clear_tabu_exchange(0)
+                mySolution.clear_global_tabu(1000000)
+                step("exchange", i, j)
+                mySolution.two_opt(*twoOpt, True)
+                mySolution.get_objective()
+                mySolution.GlobalTabu += mySolution.TabuRelocate
+                mySolution.clear_tabu_two_opt(0)
+                mySolution.clear_global_tabu(1000000)
+                step("two_opt", i, j)
+                mySolution.tick_tabu()                                  # release moves whose tabu tenure has expired
+                if mySolution.iterationHook is not None:
+                    if mySolution.iterationHook(mySolution, i, j, (bestObjectiv, incumbent) if incumbent is not None else None):
+                        step("migration", i, j)
+                if checkpoint is not None and time.perf_counter() - lastCheckpoint >= checkpointInterval:
+                    save(i, j+1)
+        if timedOut:
+            break
+        if stagnation is not None and sinceImprovement >= stagnation:
+            break
+    if checkpoint is not None and timedOut:
+        save(*stopped)                                                  # resume where the deadline stopped the search
+    elif checkpoint is not None:
+        save(runs, 0)                                                   # the search is finished
+    if bestObjectiv != -1 and mySolution.journal is not None:
+        mySolution.undo()                                               # roll back to the best solution
+    elif bestObjectiv != -1:
+        mySolution.restore(incumbent)
+    mySolution.journal = None
+    mySolution.trace = None
+    return mySolution, bestObjectiv, timedOut
 
-            
+def checkpoint_path(directory, file):
+    """Checkpoint file of an instance file in directory."""
+    return os.path.join(directory, os.path.normpath(file).replace(os.sep, "_")[:-4] + ".json")
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the savings algorithm and the tabu local search on Solomon instances.")
+    parser.add_argument("files", nargs="*", default=[f for folder in folders for f in folder])
+    parser.add_argument("--time", type=float, default=None, help="time limit per instance in seconds")
+    parser.add_argument("--stagnation", type=int, default=None, help="stop after this many iterations without improvement")
+    parser.add_argument("--checkpoints", default=None, help="directory for checkpoint files, existing ones are resumed")
+    parser.add_argument("--verbosity", type=int, default=CW_Savings.PROGRESS, choices=range(4),
+                        help="0: quiet, 1: new best solutions (default), 2: solution after every step, 3: every accepted move")
+    parser.add_argument("--trace-format", default="csv", choices=["csv", "npz"], help="format of the convergence trace files")
+    parser.add_argument("--batch", type=int, default=10000, help="trace points buffered before they are written")
+    parser.add_argument("--background", action="store_true", help="write the trace files from a background thread")
+    args = parser.parse_args()
+
+    bestSolutions = []
+    for file in args.files:
+        myVRP = CW_Savings.VRP(file)
+        traceName = file[:-4] + "." + args.trace_format
+        checkpoint = checkpoint_path(args.checkpoints, file) if args.checkpoints is not None else None
+        with CW_Savings.Trace(args.verbosity, traceName, args.batch, args.background) as trace:
+            bestSolution, bestObjectiv, timedOut = solve(myVRP, trace=trace, timeLimit=args.time, stagnation=args.stagnation,
+                                                         checkpoint=checkpoint)
+        bestSolutions.append(bestSolution)
 
+    print("_______________________________________________________ SOLUTIONS: _______________________________________________________")
+    for i in bestSolutions:
+        print(i.vrpdata.InstanceFile + ": " + str(i.objective))
+        #print(i)
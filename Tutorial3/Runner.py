@@ -0,0 +1,180 @@
+import CW_Savings
+import LocalSeatch
+import argparse
+import json
+import multiprocessing
+import multiprocessing.connection
+import os
+import statistics
+import time
+
+parameterSets = {                                                   # keyword arguments of LocalSeatch.solve
+    "default": {"relocate": (0.7, 0.001), "exchange": (0.7, 0.000001), "twoOpt": (0.7, 0.001)},
+    "greedy": {"relocate": (1, 0), "exchange": (1, 0), "twoOpt": (1, 0)},
+    "inter": {"relocate": (0.7, 0.001), "exchange": (0.7, 0.000001), "twoOpt": (0.7, 0.001), "interRoute": True},
+    "compact": {"relocate": (0.7, 0.001), "exchange": (0.7, 0.000001), "twoOpt": (0.7, 0.001), "interRoute": "compact"},
+    "vnd": {"vnd": "first"},
+    "aspiration": {"relocate": (0.7, 0.001), "exchange": (0.7, 0.000001), "twoOpt": (0.7, 0.001), "tenure": 50,
+                   "aspiration": True},
+}
+
+instances = {}                                                      # VRP objects loaded by this worker process
+cachedir = None                                                     # binary instance cache used by this process
+
+def init_worker(cache):
+    """Initialize a worker process."""
+    global cachedir
+    cachedir = cache
+
+def load_instance(file):
+    """Return the VRP object of file, loading it only once per process."""
+    if file not in instances:
+        instances[file] = CW_Savings.VRP(file, cachedir=cachedir)
+    return instances[file]
+
+def run_job(job):
+    """Run one (instance, seed, parameter set) job.
+    job(dict): file, seed, params, runs, iterations, timeout (seconds or None), stagnation (iterations or None) and
+    checkpoint (file or None)
+    Returns a dict with the job, its result and the operator metrics of the solution."""
+    start = time.perf_counter()
+    myVRP = load_instance(job["file"])
+    deadline = None if job["timeout"] is None else start + job["timeout"]
+    mySolution, bestObjectiv, timedOut = LocalSeatch.solve(myVRP, seed=job["seed"], runs=job["runs"],
+                                                           iterations=job["iterations"], deadline=deadline,
+                                                           stagnation=job["stagnation"],
+                                                           checkpoint=job["checkpoint"], **parameterSets[job["params"]])
+    result = dict(job)
+    result.update({"objective": bestObjectiv, "timedOut": timedOut, "time": time.perf_counter() - start,
+                   "worker": os.getpid(), "metrics": mySolution.metrics_dict()})
+    return result
+
+def make_jobs(files, seeds, params, runs, iterations, timeout, stagnation=None, checkpoints=None):
+    """Build the job list; the seed of a job only depends on its position in the seed list.
+    With a checkpoints directory every job gets its own checkpoint file there, so a rerun resumes unfinished jobs."""
+    return [{"file": file, "seed": seed, "params": name, "runs": runs, "iterations": iterations, "timeout": timeout,
+             "stagnation": stagnation,
+             "checkpoint": None if checkpoints is None else LocalSeatch.checkpoint_path(checkpoints, file)[:-5] + "-" + name + "-" + str(seed) + ".json"}
+            for file in files for name in params for seed in seeds]
+
+def summarize(results):
+    """Compute best and mean objective per (instance, parameter set); failed jobs are skipped.
+    Results are sorted by job before aggregation, so the summary does not depend on the completion order."""
+    summary = {}
+    for result in sorted(results, key=lambda r: (r["file"], r["params"], r["seed"])):
+        if "error" in result:
+            continue
+        key = result["file"] + " [" + result["params"] + "]"
+        summary.setdefault(key, [])
+        if result["objective"] != -1:
+            summary[key].append(result["objective"])
+    return {key: {"best": min(values) if values else -1, "mean": statistics.mean(values) if values else -1,
+                  "valid": len(values)} for key, values in summary.items()}
+
+def worker(cache, conn):
+    """Worker process: run the jobs received on conn one after the other and send back their results.
+    A job that raises an exception is sent back with objective -1 and the error; None ends the worker."""
+    init_worker(cache)
+    for job in iter(conn.recv, None):
+        try:
+            result = run_job(job)
+        except Exception as error:                                  # a failed job must not end the whole sweep
+            result = dict(job, objective=-1, error=repr(error))
+        conn.send(result)
+
+def start_worker(cache):
+    """Start a worker process and return it with the parent end of its pipe."""
+    conn, child = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=worker, args=(cache, child), daemon=True)
+    process.start()
+    child.close()
+    return process, conn
+
+def run(jobs, workers=None, stream=None, cache=None, grace=10.0):
+    """Run the jobs on a pool of worker processes.
+    Every finished job is passed to stream (if given) as soon as it completes; a job that raised an exception or
+    whose worker died gets objective -1 and the error. The timeout of a job is only checked between iterations, so
+    a job still running grace seconds after its timeout is terminated, recorded as timed out and its worker replaced. If
+    cache is a directory, the instances are cached there first and the workers share their memory-mapped distance
+    matrices.
+    Returns the list of results in job order."""
+    if cache is not None:
+        for file in sorted(set(job["file"] for job in jobs)):
+            CW_Savings.VRP(file, cachedir=cache)
+    results = [None] * len(jobs)
+    pending = list(range(len(jobs) - 1, -1, -1))                    # job indices, the next one last
+    idle = [start_worker(cache) for i in range(min(workers or os.cpu_count(), len(jobs)))]
+    running = {}                                                    # pipe of a busy worker: (process, job index, end)
+
+    def finish(index, result):
+        results[index] = result
+        if stream is not None:
+            stream(result)
+
+    while pending or running:
+        while pending and idle:
+            process, conn = idle.pop()
+            index = pending.pop()
+            conn.send(jobs[index])
+            timeout = jobs[index]["timeout"]
+            running[conn] = (process, index, None if timeout is None else time.perf_counter() + timeout + grace)
+        ends = [end for process, index, end in running.values() if end is not None]
+        wait = None if not ends else max(0.0, min(ends) - time.perf_counter())
+        for conn in multiprocessing.connection.wait(list(running), wait):
+            process, index, end = running.pop(conn)
+            try:
+                finish(index, conn.recv())
+                idle.append((process, conn))
+            except (EOFError, OSError):                             # the worker died without reporting
+                process.join()
+                finish(index, dict(jobs[index], objective=-1, error="exit code " + str(process.exitcode)))
+                idle.append(start_worker(cache))
+        for conn, (process, index, end) in list(running.items()):
+            if end is not None and time.perf_counter() > end:       # an iteration ran far past the timeout
+                process.terminate()
+                process.join()
+                conn.close()
+                del running[conn]
+                finish(index, dict(jobs[index], objective=-1, error="timed out", timedOut=True))
+                idle.append(start_worker(cache))
+    for process, conn in idle:
+        conn.send(None)
+        process.join()
+    return results
+
+def print_result(result):
+    """Print a finished job."""
+    if "error" in result:
+        print(result["file"] + " [" + result["params"] + "] seed " + str(result["seed"]) + ": failed: " + result["error"],
+              flush=True)
+        return
+    print(result["file"] + " [" + result["params"] + "] seed " + str(result["seed"]) + ": " + str(round(result["objective"], 2))
+          + (" (timeout)" if result["timedOut"] else "") + " in " + str(round(result["time"], 2)) + " s", flush=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the local search on many instances, seeds and parameter sets in parallel.")
+    parser.add_argument("files", nargs="*", default=[f for folder in LocalSeatch.folders for f in folder])
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: number of cores)")
+    parser.add_argument("--seeds", type=int, default=4, help="number of seeds per instance and parameter set")
+    parser.add_argument("--params", nargs="+", default=["default"], choices=sorted(parameterSets))
+    parser.add_argument("--runs", type=int, default=2)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--timeout", type=float, default=None, help="time limit per job in seconds, checked between iterations; "
+                        "a job still running --grace seconds later is terminated")
+    parser.add_argument("--grace", type=float, default=10.0, help="seconds after --timeout until a job is terminated")
+    parser.add_argument("--stagnation", type=int, default=None, help="stop a job after this many iterations without improvement")
+    parser.add_argument("--checkpoints", default=None, help="directory for checkpoint files, existing ones are resumed")
+    parser.add_argument("--cache", default=None, help="directory for binary instance caches")
+    parser.add_argument("--output", default=None, help="write all results and the summary to this JSON file")
+    args = parser.parse_args()
+
+    jobs = make_jobs(args.files, range(args.seeds), args.params, args.runs, args.iterations, args.timeout, args.stagnation,
+                     args.checkpoints)
+    results = run(jobs, args.workers, stream=print_result, cache=args.cache, grace=args.grace)
+    summary = summarize(results)
+    print("_______________________________________________________ SUMMARY: _______________________________________________________")
+    for key, values in summary.items():
+        print(key + ": best " + str(round(values["best"], 2)) + ", mean " + str(round(values["mean"], 2)))
+    if args.output is not None:
+        with open(args.output, "w") as fp:
+            json.dump({"results": results, "summary": summary}, fp, indent=1)
@@ -0,0 +1,169 @@
+import CW_Savings
+import LocalSeatch
+import Runner
+import argparse
+import concurrent.futures
+import json
+import os
+import socketserver
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+instances = OrderedDict()                                           # VRP objects of this worker, keyed by instance_key
+maxInstances = 8                                                    # instances kept per worker, least recently used are dropped
+cachedir = None                                                     # binary instance cache used by this process
+defaults = {"params": "default", "runs": 1, "iterations": 50, "seed": None, "time": None, "stagnation": None}
+
+def init_worker(cache, budget=None, keep=8):
+    """Initialize a worker process.
+    cache(string): directory for binary instance caches
+    budget(float): default time budget of the requests in seconds (default=None)
+    keep(int): number of parsed instances kept in memory (default=8)"""
+    global cachedir, maxInstances
+    cachedir = cache
+    defaults["time"] = budget
+    maxInstances = keep
+
+def instance_key(file):
+    """Key of an instance file in the cache; it changes when the file is modified."""
+    stat = os.stat(file)
+    return (os.path.abspath(file), stat.st_mtime_ns, stat.st_size)
+
+def load_instance(file):
+    """Return the VRP object of file and whether it was cached; the maxInstances most recently used parsed files
+    stay in memory for later requests."""
+    key = instance_key(file)
+    if key in instances:
+        instances.move_to_end(key)
+        return instances[key], True
+    instances[key] = CW_Savings.VRP(file, cachedir=cachedir)
+    while len(instances) > maxInstances:
+        instances.popitem(last=False)
+    return instances[key], False
+
+def solve_request(request):
+    """Solve one request in a worker process.
+    request(dict): file and optional id, params, runs, iterations, seed, time (budget in seconds), stagnation and
+    tenure and aspiration, which override those of the parameter set
+    Returns the response dict with the best objective (or -1), its routes and timing information."""
+    start = time.perf_counter()
+    options = dict(defaults)
+    options.update(request)
+    if options["params"] not in Runner.parameterSets:
+        raise ValueError("unknown parameter set " + str(options["params"]))
+    params = dict(Runner.parameterSets[options["params"]])
+    for key in ("tenure", "aspiration"):
+        if key in request:
+            params[key] = request[key]
+    myVRP, cached = load_instance(options["file"])
+    loaded = time.perf_counter()
+    mySolution, bestObjectiv, timedOut = LocalSeatch.solve(myVRP, seed=options["seed"], runs=options["runs"],
+                                                           iterations=options["iterations"], timeLimit=options["time"],
+                                                           stagnation=options["stagnation"], **params)
+    return {"id": request.get("id"), "objective": bestObjectiv, "valid": mySolution.solutionValid,
+            "routes": [list(route) for route in mySolution.snapshot()], "timedOut": timedOut, "cached": cached,
+            "loadTime": loaded - start, "time": time.perf_counter() - start, "worker": os.getpid()}
+
+class SolveService:
+    """Class for a long-lived solve service.
+
+    Queues solve requests on a pool of worker processes that keep their parsed instances warm"""
+
+    def __init__(self, workers=None, cache=None, budget=None, keep=8):
+        """Start the worker pool.
+
+        workers(int): number of worker processes (default=None: number of cores)
+        cache(string): directory for binary instance caches shared by the workers (default=None)
+        budget(float): time budget in seconds of requests without one (default=None)
+        keep(int): number of parsed instances every worker keeps in memory (default=8)"""
+        self.pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                                           initargs=(cache, budget, keep))
+
+    def submit(self, request, respond):
+        """Queue a request (dict) and call respond with the response dict once it is solved or failed."""
+        if "file" not in request:
+            respond({"id": request.get("id"), "error": "request has no file"})
+            return
+        future = self.pool.submit(solve_request, request)
+
+        def done(future):
+            try:
+                response = future.result()
+            except Exception as error:
+                response = {"id": request.get("id"), "error": repr(error)}
+            respond(response)
+        future.add_done_callback(done)
+
+    def serve_lines(self, lines, write):
+        """Read JSON requests from lines and write one JSON response line per request with write.
+        Responses are written as soon as they are ready, so their order can differ from the requests; the id field
+        of a request is copied into its response. Returns after all requests are answered."""
+        lock = threading.Lock()
+        pending = []
+
+        def respond(response, finished=None):
+            try:
+                with lock:
+                    write(json.dumps(response) + "\n")
+            finally:
+                if finished is not None:
+                    finished.set()                                  # a failed write must not block the wait below
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError as error:
+                respond({"error": "invalid JSON: " + str(error)})
+                continue
+            if not isinstance(request, dict):
+                respond({"error": "request is not a JSON object"})
+                continue
+            finished = threading.Event()
+            pending.append(finished)
+            self.submit(request, lambda response, finished=finished: respond(response, finished))
+        for finished in pending:
+            finished.wait()
+
+    def shutdown(self):
+        self.pool.shutdown()
+
+class LineHandler(socketserver.StreamRequestHandler):
+    """Serve the JSON lines of one socket connection."""
+
+    def handle(self):
+        def write(text):
+            self.wfile.write(text.encode())
+            self.wfile.flush()
+        self.server.service.serve_lines((line.decode() for line in self.rfile), write)
+
+class LineServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Solve VRP requests (JSON lines) with warm instances on a worker pool.")
+    parser.add_argument("--port", type=int, default=None, help="listen on localhost:port instead of stdin/stdout")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: number of cores)")
+    parser.add_argument("--cache", default=None, help="directory for binary instance caches")
+    parser.add_argument("--time", type=float, default=None, help="default time budget per request in seconds")
+    parser.add_argument("--instances", type=int, default=8, help="parsed instances kept in memory per worker (default 8)")
+    args = parser.parse_args()
+
+    service = SolveService(args.workers, args.cache, args.time, args.instances)
+    try:
+        if args.port is None:
+            def write(text):
+                sys.stdout.write(text)
+                sys.stdout.flush()
+            service.serve_lines(sys.stdin, write)
+        else:
+            with LineServer(("127.0.0.1", args.port), LineHandler) as server:
+                server.service = service
+                server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.shutdown()